@@ -1,16 +1,34 @@
 import os
+import re
+import asyncio
+import json
+import bisect
+import copy
+import hashlib
+import heapq
+import unicodedata
+from collections import Counter, OrderedDict
+import uuid
 import calendar
-from datetime import datetime, date
+import click
+import threading
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 from werkzeug.utils import secure_filename
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g, session, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from flask.cli import AppGroup
 from flask_login import (
     LoginManager, UserMixin, login_user, login_required,
     logout_user, current_user
 )
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import text
+from sqlalchemy import text, event, Insert, Update, Delete
 
 
 # ---------------- App / Config ----------------
@@ -19,6 +37,8 @@ app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-change-me")
 app.config["UPLOAD_FOLDER"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "uploads")
 app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024  # 5MB max
+# snapshots enviados em /importar ficam aqui até o job de importação terminar
+app.config["IMPORTACAO_FOLDER"] = os.path.join(app.instance_path, "importacoes")
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 db_url = os.environ.get("DATABASE_URL")
@@ -33,7 +53,53 @@ else:
 
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-db = SQLAlchemy(app)
+# Réplica de leitura opcional: rotas marcadas com @leitura_replica leem daqui
+db_read_url = os.environ.get("DATABASE_READ_URL")
+if db_read_url:
+    if db_read_url.startswith("postgres://"):
+        db_read_url = db_read_url.replace("postgres://", "postgresql://", 1)
+    app.config["SQLALCHEMY_BINDS"] = {"leitura": db_read_url}
+
+# Depois de um POST, o mesmo usuário continua lendo do primário por alguns
+# segundos (read-your-own-writes no redirect, mesmo com atraso da réplica)
+app.config["REPLICA_JANELA_ESCRITA"] = float(os.environ.get("REPLICA_JANELA_ESCRITA", "5"))
+
+# Dashboard assíncrono: as duas consultas do GET / em paralelo (requer asyncpg/aiosqlite).
+# Reduz a latência de cada GET /; não aumenta quantas requisições um worker atende.
+app.config["ASYNC_DASHBOARD"] = os.environ.get("ASYNC_DASHBOARD", "0") == "1"
+
+# Arquivamento: transações pagas e encerradas há mais de N meses vão para transacoes_arquivo
+app.config["ARQUIVO_MESES"] = int(os.environ.get("ARQUIVO_MESES", "24"))
+
+# Jobs em segundo plano (pool local, sem broker externo)
+app.config["JOBS_WORKERS"] = int(os.environ.get("JOBS_WORKERS", "2"))
+app.config["JOBS_MAX_TENTATIVAS"] = int(os.environ.get("JOBS_MAX_TENTATIVAS", "3"))
+# Retoma jobs pendentes da tabela `jobs` ao iniciar (fila durável)
+app.config["JOBS_DURAVEIS"] = os.environ.get("JOBS_DURAVEIS", "0") == "1"
+# Job "executando" sem heartbeat há mais que isso é considerado abandonado (worker morreu)
+app.config["JOBS_LEASE_SEGUNDOS"] = int(os.environ.get("JOBS_LEASE_SEGUNDOS", "300"))
+
+
+
+class RoteadorSession(FlaskSQLAlchemySession):
+    """Envia leituras para a réplica quando a requisição atual permite; escritas e flush sempre no primário."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and usar_replica()
+            and not self._flushing
+            and not isinstance(clause, (Insert, Update, Delete))
+        ):
+            return self._db.engines["leitura"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def usar_replica() -> bool:
+    return has_request_context() and g.get("usar_replica", False)
+
+
+db = SQLAlchemy(app, session_options={"class_": RoteadorSession})
 
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
@@ -47,19 +113,51 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(180), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     foto_perfil = db.Column(db.String(255), nullable=True)
+    orcamentos_mes = db.Column(db.Integer, nullable=True)  # último mês (_num_mes) com a janela de orçamentos reavaliada
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# Dinheiro é gravado em centavos inteiros (colunas *_centavos); os valores em reais
+# que rotas, templates e JSON usam são propriedades calculadas a partir deles.
+class ValoresEmReais:
+    @property
+    def valor_total(self) -> float:
+        return self.valor_total_centavos / 100
+
+    @valor_total.setter
+    def valor_total(self, reais):
+        self.valor_total_centavos = para_centavos(reais)
+
+    @property
+    def valor_parcela(self) -> float:
+        return self.valor_parcela_centavos / 100
+
+
 class Categoria(db.Model):
     __tablename__ = "categorias"
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     nome = db.Column(db.String(100), nullable=False, index=True)
+    orcamento_centavos = db.Column(db.BigInteger, nullable=True)  # limite mensal de saídas (positivo)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    @property
+    def orcamento(self) -> float | None:
+        return self.orcamento_centavos / 100 if self.orcamento_centavos else None
 
-class Transacao(db.Model):
+    @orcamento.setter
+    def orcamento(self, reais):
+        self.orcamento_centavos = para_centavos(reais) if reais else None
+
+
+class Transacao(ValoresEmReais, db.Model):
     __tablename__ = "transacoes"
+    __table_args__ = (
+        db.Index("ix_transacoes_user_updated", "user_id", "updated_at"),
+        db.Index("ix_transacoes_user_fingerprint", "user_id", "fingerprint"),
+        db.Index("ix_transacoes_user_hash_importacao", "user_id", "hash_importacao"),
+        db.Index("ix_transacoes_user_data", "user_id", "data"),
+    )
     id = db.Column(db.Integer, primary_key=True)
 
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
@@ -70,19 +168,158 @@ class Transacao(db.Model):
     categoria = db.relationship("Categoria", lazy=True)
 
     descricao = db.Column(db.String(255), nullable=False)
-    valor_total = db.Column(db.Float, nullable=False)  # entrada +, saída -
+    valor_total_centavos = db.Column(db.BigInteger, nullable=False)  # entrada +, saída -
     tipo = db.Column(db.String(20), nullable=False)    # "entrada"/"saida"
     data = db.Column(db.Date, nullable=False)
 
     parcelas = db.Column(db.Integer, nullable=False, default=1)
-    valor_parcela = db.Column(db.Float, nullable=False)
+    valor_parcela_centavos = db.Column(db.BigInteger, nullable=False)  # 1ª parcela ou mensalidade
 
     observacoes = db.Column(db.Text, nullable=True)
     pago = db.Column(db.Boolean, nullable=False, default=False)
     recorrente = db.Column(db.Boolean, nullable=False, default=False)  # mensalidade
     tipo_entrada = db.Column(db.String(20), nullable=True)  # 'salario', 'outros', None
 
+    # sha1(descrição normalizada | valor_total | data) para achar duplicadas
+    fingerprint = db.Column(db.String(40), nullable=True)
+    # sha1(descrição como gravada | valor_total | data | parcelas): chave da importação legada
+    hash_importacao = db.Column(db.String(40), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # agenda materializada das parcelas (somente saídas não recorrentes)
+    agenda = db.relationship(
+        "ParcelaAgenda", lazy=True, cascade="all, delete-orphan",
+        order_by="ParcelaAgenda.numero",
+    )
+
+
+class TransacaoRemovida(db.Model):
+    """Tombstone de exclusão, para o /api/sync avisar os clientes."""
+    __tablename__ = "transacoes_removidas"
+    __table_args__ = (
+        db.Index("ix_transacoes_removidas_user_removido", "user_id", "removido_em"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    transacao_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    removido_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ParcelaAgenda(db.Model):
+    __tablename__ = "parcelas_agenda"
+    __table_args__ = (
+        db.Index("ix_parcelas_agenda_user_venc_pago", "user_id", "vencimento", "pago"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    transacao_id = db.Column(db.Integer, db.ForeignKey("transacoes.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+
+    numero = db.Column(db.Integer, nullable=False)  # 1..parcelas
+    vencimento = db.Column(db.Date, nullable=False)
+    valor_centavos = db.Column(db.BigInteger, nullable=False)  # mesmo sinal do total da transação
+    pago = db.Column(db.Boolean, nullable=False, default=False)
+
+    @property
+    def valor(self) -> float:
+        return self.valor_centavos / 100
+
+
+class TransacaoArquivo(ValoresEmReais, db.Model):
+    """Partição fria: transações pagas e totalmente encerradas (mesmo id da original)."""
+    __tablename__ = "transacoes_arquivo"
+    __table_args__ = (
+        db.Index("ix_transacoes_arquivo_user_data", "user_id", "data"),
+        db.Index("ix_transacoes_arquivo_user_fingerprint", "user_id", "fingerprint"),
+        db.Index("ix_transacoes_arquivo_user_hash_importacao", "user_id", "hash_importacao"),
+        db.Index("ix_transacoes_arquivo_user_arquivado", "user_id", "arquivado_em", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey("categorias.id"), nullable=True)
+
+    descricao = db.Column(db.String(255), nullable=False)
+    valor_total_centavos = db.Column(db.BigInteger, nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    parcelas = db.Column(db.Integer, nullable=False, default=1)
+    valor_parcela_centavos = db.Column(db.BigInteger, nullable=False)
+    observacoes = db.Column(db.Text, nullable=True)
+    pago = db.Column(db.Boolean, nullable=False, default=True)
+    recorrente = db.Column(db.Boolean, nullable=False, default=False)
+    tipo_entrada = db.Column(db.String(20), nullable=True)
+    fingerprint = db.Column(db.String(40), nullable=True)  # o mesmo da original
+    hash_importacao = db.Column(db.String(40), nullable=True)  # idem (importação idempotente)
+
+    created_at = db.Column(db.DateTime, nullable=True)
+    arquivado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ResumoMensalArquivo(db.Model):
+    """Totais por mês/categoria das transações arquivadas (calculados antes de mover)."""
+    __tablename__ = "resumos_mensais_arquivo"
+    __table_args__ = (
+        db.Index("ix_resumos_arquivo_user_ano_mes", "user_id", "ano", "mes"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    categoria_id = db.Column(db.Integer, nullable=True)
+    entradas_centavos = db.Column(db.BigInteger, nullable=False, default=0)
+    saidas_centavos = db.Column(db.BigInteger, nullable=False, default=0)  # positivo
+
+    @property
+    def entradas(self) -> float:
+        return self.entradas_centavos / 100
+
+    @property
+    def saidas(self) -> float:
+        return self.saidas_centavos / 100
+
+
+class AlertaOrcamento(db.Model):
+    """Categoria/mês cujo gasto passou de um limiar do orçamento (mantido a cada escrita)."""
+    __tablename__ = "alertas_orcamento"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "categoria_id", "ano", "mes", name="uq_alerta_orcamento"),
+        db.Index("ix_alertas_orcamento_user_ano_mes", "user_id", "ano", "mes"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey("categorias.id"), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    nivel = db.Column(db.Integer, nullable=False)  # maior limiar atingido (80, 100)
+    gasto_centavos = db.Column(db.BigInteger, nullable=False)
+
+    @property
+    def gasto(self) -> float:
+        return self.gasto_centavos / 100
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    parametros = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), nullable=False, default="pendente", index=True)  # pendente/executando/concluido/erro
+    progresso = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    resultado = db.Column(db.Text, nullable=True)  # JSON
+    erro = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+@db.event.listens_for(Transacao, "before_insert")
+@db.event.listens_for(Transacao, "before_update")
+def _normalizar_transacao(mapper, connection, t):
+    colunas = colunas_calculadas(t.descricao, t.valor_total_centavos, t.data, t.parcelas or 1, bool(t.recorrente))
+    for campo, valor in colunas.items():
+        setattr(t, campo, valor)
 
 
 @login_manager.user_loader
@@ -90,6 +327,38 @@ def load_user(user_id):
     return db.session.get(User, int(user_id))
 
 
+# ---------------- Réplica de leitura ----------------
+def leitura_replica(fn):
+    """Marca a view como somente leitura: GETs dela podem ir para a réplica."""
+    fn.leitura_replica = True
+    return fn
+
+
+@app.before_request
+def escolher_banco():
+    if "leitura" not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+    if request.method != "GET":
+        return
+
+    view = app.view_functions.get(request.endpoint)
+    if not getattr(view, "leitura_replica", False):
+        return
+
+    # read-your-own-writes: logo após uma escrita, continua no primário
+    if time.time() - session.get("ultima_escrita", 0) < app.config["REPLICA_JANELA_ESCRITA"]:
+        return
+
+    g.usar_replica = True
+
+
+@app.after_request
+def registrar_escrita(response):
+    if "leitura" in app.config.get("SQLALCHEMY_BINDS", {}) and request.method == "POST":
+        session["ultima_escrita"] = time.time()
+    return response
+
+
 # ---------------- Helpers ----------------
 def adicionar_meses(data_ref: date, n: int) -> date:
     mes = data_ref.month - 1 + n
@@ -103,75 +372,175 @@ def ym_label(ano: int, mes: int) -> str:
     return f"{mes:02d}/{ano}"
 
 
-def calcular_resumo_mes(transacoes, ano: int, mes: int) -> tuple[float, float, float]:
+def intervalo_mes(ano: int, mes: int) -> tuple[date, date]:
+    """[primeiro dia do mês, primeiro dia do mês seguinte)"""
+    inicio = date(ano, mes, 1)
+    return inicio, adicionar_meses(inicio, 1)
+
+
+def para_centavos(valor) -> int:
+    """Reais -> centavos; meio centavo arredonda para longe do zero (-43.885 -> -4389)."""
+    return int((Decimal(str(valor)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def parcela_centavos(total: int, parcelas: int, i: int) -> int:
+    """
+    Valor da parcela i (0..parcelas-1), com o sinal do total. As primeiras
+    `total % parcelas` parcelas levam 1 centavo a mais, então a soma fecha com o total.
+    """
+    base, resto = divmod(abs(total), max(parcelas, 1))
+    valor = base + (1 if i < resto else 0)
+    return -valor if total < 0 else valor
+
+
+def colunas_calculadas(descricao: str, valor_total_centavos: int, data_ref: date, parcelas: int,
+                       recorrente: bool) -> dict:
+    """Colunas derivadas de uma transação: o evento do mapper e os bulk inserts usam esta mesma função."""
+    if recorrente:
+        parcela = valor_total_centavos
+    else:
+        parcela = parcela_centavos(valor_total_centavos, parcelas, 0)
+    return {
+        "valor_parcela_centavos": parcela,
+        "fingerprint": fingerprint_transacao(descricao, valor_total_centavos, data_ref),
+        "hash_importacao": hash_importacao(descricao, valor_total_centavos, data_ref, parcelas),
+    }
+
+
+def linha_bulk_transacao(valor_total: float, **campos) -> dict:
+    """Mapping completo para bulk_insert_mappings(Transacao, ...), que não dispara os eventos do mapper."""
+    linha = dict(campos, valor_total_centavos=para_centavos(valor_total))
+    linha.update(colunas_calculadas(
+        linha["descricao"], linha["valor_total_centavos"], linha["data"],
+        linha.get("parcelas") or 1, bool(linha.get("recorrente")),
+    ))
+    return linha
+
+
+def saida_no_mes_centavos(t: dict, ano: int, mes: int) -> int:
+    """Quanto a saída `t` pesa em (ano, mes), em centavos positivos; O(1)."""
+    i = (ano - t["data"].year) * 12 + (mes - t["data"].month)  # parcela que cai no mês
+    if i < 0:
+        return 0
+    if t.get("recorrente", False):
+        # Mensalidade: cobra todo mês a partir do mês de início
+        return abs(t["valor_parcela_centavos"])
+    parcelas = max(int(t.get("parcelas", 1)), 1)
+    if i >= parcelas:
+        return 0
+    return abs(parcela_centavos(t["valor_total_centavos"], parcelas, i))
+
+
+def gerar_agenda(t: Transacao):
+    """
+    (Re)gera as linhas de parcelas_agenda da transação.
+    Mantém como pagas as parcelas que já estavam pagas (pelo número).
+    """
+    pagas = {p.numero for p in t.agenda if p.pago}
+    t.agenda = [ParcelaAgenda(**linha) for linha in linhas_agenda(t, pagas)]
+
+
+def linhas_agenda(t, pagas=frozenset()) -> list[dict]:
+    """Linhas da agenda (sem transacao_id) para uma transação; vazio se não se aplica."""
+    if t.recorrente or t.valor_total_centavos >= 0:
+        return []
+    parcelas = max(t.parcelas, 1)
+    return [
+        {
+            "user_id": t.user_id,
+            "numero": i + 1,
+            "vencimento": adicionar_meses(t.data, i),
+            "valor_centavos": parcela_centavos(t.valor_total_centavos, parcelas, i),
+            "pago": bool(t.pago) or (i + 1) in pagas,
+        }
+        for i in range(parcelas)
+    ]
+
+
+def parcelas_do_mes(user_id: int, ano: int, mes: int, somente_pendentes: bool = False):
+    inicio, fim = intervalo_mes(ano, mes)
+    q = (
+        db.session.query(ParcelaAgenda, Transacao.descricao, Transacao.parcelas)
+        .join(Transacao, ParcelaAgenda.transacao_id == Transacao.id)
+        .filter(
+            ParcelaAgenda.user_id == user_id,
+            ParcelaAgenda.vencimento >= inicio,
+            ParcelaAgenda.vencimento < fim,
+        )
+    )
+    if somente_pendentes:
+        q = q.filter(ParcelaAgenda.pago == False)
+    return q.order_by(ParcelaAgenda.vencimento.asc(), ParcelaAgenda.id.asc()).all()
+
+
+def total_parcelas_mes(user_id: int, ano: int, mes: int, somente_pendentes: bool = False) -> float:
+    inicio, fim = intervalo_mes(ano, mes)
+    q = db.session.query(db.func.coalesce(db.func.sum(ParcelaAgenda.valor_centavos), 0)).filter(
+        ParcelaAgenda.user_id == user_id,
+        ParcelaAgenda.vencimento >= inicio,
+        ParcelaAgenda.vencimento < fim,
+    )
+    if somente_pendentes:
+        q = q.filter(ParcelaAgenda.pago == False)
+    return abs(int(q.scalar())) / 100
+
+
+GRAFICO_MESES_ANTES = 3
+GRAFICO_MESES_DEPOIS = 9
+
+
+def _saida_fora_da_agenda(t: dict, ano: int, mes: int) -> int:
+    """
+    Saídas que o dashboard ainda calcula a partir da transação: mensalidades (não têm
+    agenda) e arquivadas (a agenda some no arquivamento). As demais vêm de parcelas_agenda.
+    """
+    if t["valor_total_centavos"] >= 0 or not (t.get("recorrente") or t.get("arquivada")):
+        return 0
+    return saida_no_mes_centavos(t, ano, mes)
+
+
+def calcular_resumo_mes(transacoes, ano: int, mes: int, parcelas_centavos: int = 0) -> tuple[float, float, float]:
     """
     Entradas: soma valor_total (positivo) no mês.
-    Saídas: soma de parcelas no mês (abs(valor_parcela)).
+    Saídas: parcelas da agenda que caem no mês (`parcelas_centavos`, positivo) + mensalidades.
+    Somas em centavos inteiros; os três valores voltam convertidos para reais.
     """
-    entradas_mes = 0.0
-    saidas_mes = 0.0
+    entradas_mes = 0
+    saidas_mes = parcelas_centavos
 
     for t in transacoes:
-        if t["valor_total"] > 0:
+        if t["valor_total_centavos"] > 0:
             if t["data"].year == ano and t["data"].month == mes:
-                entradas_mes += t["valor_total"]
+                entradas_mes += t["valor_total_centavos"]
         else:
-            parcelas = max(int(t.get("parcelas", 1)), 1)
-            valor_parcela_pos = abs(float(t.get("valor_parcela", t["valor_total"] / parcelas)))
-            recorrente = t.get("recorrente", False)
-
-            if recorrente:
-                # Mensalidade: cobra se a data do mês é >= data de início
-                data_inicio = t["data"]
-                data_mes = date(ano, mes, 1)
-                if data_mes >= date(data_inicio.year, data_inicio.month, 1):
-                    saidas_mes += valor_parcela_pos
-            else:
-                # Parcelado normal
-                for i in range(parcelas):
-                    dparc = adicionar_meses(t["data"], i)
-                    if dparc.year == ano and dparc.month == mes:
-                        saidas_mes += valor_parcela_pos
+            saidas_mes += _saida_fora_da_agenda(t, ano, mes)
 
     saldo_mes = entradas_mes - saidas_mes
-    return round(entradas_mes, 2), round(saidas_mes, 2), round(saldo_mes, 2)
+    return entradas_mes / 100, saidas_mes / 100, saldo_mes / 100
 
 
-def calcular_saidas_categoria_mes(transacoes, ano: int, mes: int, categoria_id: int | None) -> float:
+def calcular_saidas_categoria_mes(transacoes, ano: int, mes: int, categoria_id: int | None,
+                                  parcelas_centavos: int = 0) -> float:
     """
     Se categoria_id = None -> retorna saídas normais do mês.
     Se categoria_id != None -> retorna SOMENTE saídas dessa categoria no mês.
+    `parcelas_centavos` são as parcelas da agenda no mês já filtradas pela mesma categoria.
     """
-    total = 0.0
+    total = parcelas_centavos
 
     for t in transacoes:
-        if t["valor_total"] >= 0:
-            continue
-
         if categoria_id is not None and t.get("categoria_id") != categoria_id:
             continue
 
-        parcelas = max(int(t.get("parcelas", 1)), 1)
-        valor_parcela_pos = abs(float(t.get("valor_parcela", t["valor_total"] / parcelas)))
-        recorrente = t.get("recorrente", False)
-
-        if recorrente:
-            # Mensalidade: cobra se o mês é >= data de início
-            data_inicio = t["data"]
-            data_mes = date(ano, mes, 1)
-            if data_mes >= date(data_inicio.year, data_inicio.month, 1):
-                total += valor_parcela_pos
-        else:
-            # Parcelado normal
-            for i in range(parcelas):
-                dparc = adicionar_meses(t["data"], i)
-                if dparc.year == ano and dparc.month == mes:
-                    total += valor_parcela_pos
+        total += _saida_fora_da_agenda(t, ano, mes)
 
-    return round(total, 2)
+    return total / 100
 
 
-def calcular_grafico(transacoes, ano: int, mes: int, meses_antes: int = 3, meses_depois: int = 9):
+def calcular_grafico(transacoes, ano: int, mes: int, parcelas_por_mes: dict | None = None,
+                     meses_antes: int = GRAFICO_MESES_ANTES, meses_depois: int = GRAFICO_MESES_DEPOIS):
+    """`parcelas_por_mes`: {_num_mes: centavos positivos} das parcelas da agenda em cada mês."""
+    parcelas_por_mes = parcelas_por_mes or {}
     inicio = adicionar_meses(date(ano, mes, 1), -meses_antes)
 
     labels, entradas_vals, despesas_vals = [], [], []
@@ -180,37 +549,78 @@ def calcular_grafico(transacoes, ano: int, mes: int, meses_antes: int = 3, meses
         dref = adicionar_meses(inicio, i)
         labels.append(ym_label(dref.year, dref.month))
 
-        ent = 0.0
-        des = 0.0
+        ent = 0
+        des = parcelas_por_mes.get(_num_mes(dref.year, dref.month), 0)
 
         for t in transacoes:
-            if t["valor_total"] > 0:
+            if t["valor_total_centavos"] > 0:
                 if t["data"].year == dref.year and t["data"].month == dref.month:
-                    ent += t["valor_total"]
+                    ent += t["valor_total_centavos"]
             else:
-                parcelas = max(int(t.get("parcelas", 1)), 1)
-                valor_parcela_pos = abs(float(t.get("valor_parcela", t["valor_total"] / parcelas)))
-                recorrente = t.get("recorrente", False)
-
-                if recorrente:
-                    # Mensalidade: cobra se o mês é >= data de início
-                    data_inicio = t["data"]
-                    data_ref_mes = date(dref.year, dref.month, 1)
-                    if data_ref_mes >= date(data_inicio.year, data_inicio.month, 1):
-                        des += valor_parcela_pos
-                else:
-                    # Parcelado normal
-                    for p in range(parcelas):
-                        dp = adicionar_meses(t["data"], p)
-                        if dp.year == dref.year and dp.month == dref.month:
-                            des += valor_parcela_pos
-
-        entradas_vals.append(round(ent, 2))
-        despesas_vals.append(round(des, 2))
+                des += _saida_fora_da_agenda(t, dref.year, dref.month)
+
+        entradas_vals.append(ent / 100)
+        despesas_vals.append(des / 100)
 
     return labels, entradas_vals, despesas_vals
 
 
+def calcular_projecao(transacoes, ano: int, mes: int, meses: int, saldo_inicial: float = 0.0):
+    """
+    Projeção de fluxo de caixa a partir de (ano, mes) por `meses` meses.
+    Cada transação vira um intervalo [inicio, fim] de meses no array de deltas
+    (diferenças), e duas somas de prefixo dão o fluxo do mês e o saldo acumulado.
+    Custo O(transações + meses), independente do número de parcelas. Tudo em
+    centavos; parcelas com centavo a mais (ver parcela_centavos) viram um segundo intervalo.
+    """
+    delta_ent = [0] * (meses + 1)
+    delta_des = [0] * (meses + 1)
+
+    def somar(alvo, ini, fim, valor):
+        ini = max(ini, 0)
+        fim = min(fim, meses - 1)
+        if ini <= fim and valor:
+            alvo[ini] += valor
+            alvo[fim + 1] -= valor
+
+    for t in transacoes:
+        # índice do mês da transação relativo ao início da projeção
+        ini = (t["data"].year - ano) * 12 + (t["data"].month - mes)
+        parcelas = max(int(t.get("parcelas", 1)), 1)
+        recorrente = t.get("recorrente", False)
+
+        if t["valor_total_centavos"] > 0:
+            if recorrente:
+                somar(delta_ent, ini, meses - 1, t["valor_parcela_centavos"])
+            else:
+                somar(delta_ent, ini, ini, t["valor_total_centavos"])
+        elif recorrente:
+            somar(delta_des, ini, meses - 1, abs(t["valor_parcela_centavos"]))
+        else:
+            base, resto = divmod(abs(t["valor_total_centavos"]), parcelas)
+            somar(delta_des, ini, ini + resto - 1, base + 1)
+            somar(delta_des, ini + resto, ini + parcelas - 1, base)
+
+    labels, entradas_vals, despesas_vals, saldo_mes_vals, saldo_acum_vals = [], [], [], [], []
+    ent = des = 0
+    acumulado = para_centavos(saldo_inicial)
+    dref = date(ano, mes, 1)
+
+    for i in range(meses):
+        ent += delta_ent[i]
+        des += delta_des[i]
+        acumulado += ent - des
+
+        d = adicionar_meses(dref, i)
+        labels.append(ym_label(d.year, d.month))
+        entradas_vals.append(ent / 100)
+        despesas_vals.append(des / 100)
+        saldo_mes_vals.append((ent - des) / 100)
+        saldo_acum_vals.append(acumulado / 100)
+
+    return labels, entradas_vals, despesas_vals, saldo_mes_vals, saldo_acum_vals
+
+
 def obter_transacoes_do_usuario(user_id: int, busca: str, mostrar_pagos: bool = False, 
                                  filtro_tipo: str = None, categorias_incluir: list = None, 
                                  categorias_excluir: list = None, ordenar_por: str = "data", 
@@ -222,91 +632,373 @@ def obter_transacoes_do_usuario(user_id: int, busca: str, mostrar_pagos: bool =
     filtro_tipo: 'entrada', 'saida', ou None para ambos
     categorias_incluir: lista de IDs de categorias para incluir (se vazio, inclui todas)
     categorias_excluir: lista de IDs de categorias para excluir
+
+    Com mostrar_pagos=True também inclui as transações arquivadas
+    (transacoes_arquivo), de forma transparente para quem chama.
+    """
+    args = (user_id, busca, mostrar_pagos, filtro_tipo, categorias_incluir,
+            categorias_excluir, ordenar_por, ordem)
+    rows = db.session.execute(_select_lista(*args)).all()
+    return _transacoes_para_dicts(rows)
+
+
+# coluna de ordenação (rótulo no SELECT da lista) para cada valor de ?ordenar=
+COLUNAS_ORDEM = {
+    "data": "data",
+    "descricao": "descricao",
+    "categoria": "categoria_nome",
+    "valor_total": "valor_total_centavos",
+    "parcelas": "parcelas",
+}
+
+
+def _select_lista(user_id: int, busca: str, mostrar_pagos: bool, filtro_tipo: str,
+                  categorias_incluir: list, categorias_excluir: list, ordenar_por: str,
+                  ordem: str):
     """
+    SELECT da lista principal já ordenado. Na visão de pagos é um UNION ALL
+    de transacoes + transacoes_arquivo, ainda uma única consulta.
+    """
+    filtros = (user_id, busca, mostrar_pagos, filtro_tipo, categorias_incluir, categorias_excluir)
+    q = _select_transacoes(Transacao, *filtros)
+    if mostrar_pagos:
+        q = db.union_all(q, _select_transacoes(TransacaoArquivo, *filtros))
+    sub = q.subquery()
+
+    order_col = sub.c[COLUNAS_ORDEM.get(ordenar_por, "data")]
+    if ordem == 'asc':
+        return db.select(sub).order_by(order_col.asc(), sub.c.id.asc())
+    return db.select(sub).order_by(order_col.desc(), sub.c.id.desc())
+
+
+def _select_transacoes(M, user_id: int, busca: str, mostrar_pagos: bool, filtro_tipo: str,
+                       categorias_incluir: list, categorias_excluir: list):
+    """SELECT filtrado (sem ordem) sobre Transacao ou TransacaoArquivo (mesmas colunas)."""
     q = (
-        db.session.query(Transacao, Categoria)
-        .outerjoin(Categoria, Transacao.categoria_id == Categoria.id)
-        .filter(Transacao.user_id == user_id)
+        db.select(
+            M.id, M.descricao, M.tipo, M.data, M.parcelas,
+            M.valor_total_centavos, M.valor_parcela_centavos,
+            M.categoria_id, Categoria.nome.label("categoria_nome"),
+            M.observacoes, M.pago, M.recorrente,
+            db.literal(M is TransacaoArquivo).label("arquivada"),
+        )
+        .outerjoin(Categoria, M.categoria_id == Categoria.id)
+        .filter(M.user_id == user_id)
     )
 
     # Nunca mostrar salários nem entradas manuais na lista principal (mas mostrar NULL)
     q = q.filter(
-        (Transacao.tipo_entrada == None) | 
-        ((Transacao.tipo_entrada != 'salario') & (Transacao.tipo_entrada != 'entrada_manual'))
+        (M.tipo_entrada == None) | 
+        ((M.tipo_entrada != 'salario') & (M.tipo_entrada != 'entrada_manual'))
     )
 
     if mostrar_pagos:
-        q = q.filter(Transacao.pago == True)
+        q = q.filter(M.pago == True)
     else:
-        q = q.filter(Transacao.pago == False)
+        q = q.filter(M.pago == False)
 
     # Filtro por tipo
     if filtro_tipo == 'entrada':
-        q = q.filter(Transacao.valor_total > 0)
+        q = q.filter(M.valor_total_centavos > 0)
     elif filtro_tipo == 'saida':
-        q = q.filter(Transacao.valor_total < 0)
+        q = q.filter(M.valor_total_centavos < 0)
 
     # Filtro por categorias incluir
     if categorias_incluir:
-        q = q.filter(Transacao.categoria_id.in_(categorias_incluir))
+        q = q.filter(M.categoria_id.in_(categorias_incluir))
 
     # Filtro por categorias excluir (mas não excluir transações sem categoria)
     if categorias_excluir:
         q = q.filter(
-            (Transacao.categoria_id == None) | 
-            (~Transacao.categoria_id.in_(categorias_excluir))
+            (M.categoria_id == None) | 
+            (~M.categoria_id.in_(categorias_excluir))
         )
 
     if busca:
-        q = q.filter(Transacao.descricao.ilike(f"%{busca}%"))
-
-    # Aplica ordenação
-    if ordenar_por == 'data':
-        order_col = Transacao.data
-    elif ordenar_por == 'descricao':
-        order_col = Transacao.descricao
-    elif ordenar_por == 'categoria':
-        order_col = Categoria.nome
-    elif ordenar_por == 'valor_total':
-        order_col = Transacao.valor_total
-    elif ordenar_por == 'parcelas':
-        order_col = Transacao.parcelas
-    else:
-        order_col = Transacao.data
+        q = q.filter(M.descricao.ilike(f"%{busca}%"))
 
-    if ordem == 'asc':
-        q = q.order_by(order_col.asc(), Transacao.id.asc())
-    else:
-        q = q.order_by(order_col.desc(), Transacao.id.desc())
+    return q
 
-    rows = q.all()
 
+def _transacoes_para_dicts(rows):
     transacoes = []
-    for r, c in rows:
+    for r in rows:
         transacoes.append({
             "id": r.id,
             "descricao": r.descricao,
-            "valor_total": r.valor_total,
+            "valor_total": r.valor_total_centavos / 100,
             "tipo": r.tipo,
             "data": r.data,
             "parcelas": r.parcelas,
-            "valor_parcela": r.valor_parcela,
+            "valor_parcela": r.valor_parcela_centavos / 100,
+            "valor_total_centavos": r.valor_total_centavos,
+            "valor_parcela_centavos": r.valor_parcela_centavos,
             "categoria_id": r.categoria_id,
-            "categoria_nome": c.nome if c else None,
+            "categoria_nome": r.categoria_nome,
             "observacoes": r.observacoes,
-            "pago": r.pago,
+            "pago": bool(r.pago),
+            "recorrente": bool(r.recorrente),
+            "arquivada": bool(r.arquivada),
+        })
+    return transacoes
+
+
+def obter_transacoes_projecao(user_id: int):
+    """
+    O que ainda afeta o futuro: entradas e mensalidades em aberto (inclui os salários,
+    que a lista principal não tem) e, das saídas parceladas, só as parcelas não pagas
+    da agenda (pagas uma a uma em /parcelas/<id>/pagar saem da projeção). As parcelas
+    vêm somadas por mês no banco; cada mês entra como uma saída de parcela única.
+    """
+    rows = (
+        db.session.query(
+            Transacao.valor_total_centavos, Transacao.data, Transacao.parcelas,
+            Transacao.valor_parcela_centavos, Transacao.recorrente,
+        )
+        .filter(
+            Transacao.user_id == user_id,
+            Transacao.pago == False,
+            (Transacao.recorrente == True) | (Transacao.valor_total_centavos > 0),
+        )
+        .all()
+    )
+    transacoes = [
+        {
+            "valor_total_centavos": r.valor_total_centavos,
+            "data": r.data,
+            "parcelas": r.parcelas,
+            "valor_parcela_centavos": r.valor_parcela_centavos,
             "recorrente": r.recorrente,
+        }
+        for r in rows
+    ]
+
+    ano = db.extract("year", ParcelaAgenda.vencimento)
+    mes = db.extract("month", ParcelaAgenda.vencimento)
+    pendentes = (
+        db.session.query(ano, mes, db.func.sum(ParcelaAgenda.valor_centavos))
+        .filter(ParcelaAgenda.user_id == user_id, ParcelaAgenda.pago == False)
+        .group_by(ano, mes)
+    )
+    for a, m, total in pendentes:
+        transacoes.append({
+            "valor_total_centavos": int(total),
+            "data": date(int(a), int(m), 1),
+            "parcelas": 1,
+            "valor_parcela_centavos": int(total),
+            "recorrente": False,
         })
     return transacoes
 
 
 def listar_categorias(user_id: int):
-    return (
-        Categoria.query.filter_by(user_id=user_id)
-        .order_by(Categoria.nome.asc())
-        .all()
+    return db.session.execute(_select_categorias(user_id)).scalars().all()
+
+
+def _select_categorias(user_id: int):
+    return db.select(Categoria).filter_by(user_id=user_id).order_by(Categoria.nome.asc())
+
+
+def _select_extras(args: tuple, ano: int, mes: int, limite_entradas: int = 10):
+    """
+    Categorias (com orçamento), alertas de orçamento do mês, salários, últimas
+    entradas manuais e a agenda de parcelas do dashboard num único UNION ALL;
+    `pos` preserva a ordem de cada grupo. `args` são os da lista: a agenda vem só
+    das transações listadas (mesmos filtros), uma linha por parcela do mês e uma
+    soma por mês do gráfico.
+    """
+    user_id, mostrar_pagos = args[0], args[2]
+    data_nula = db.cast(db.null(), db.Date)
+    # colunas que só as parcelas usam
+    sem_parcela = (
+        db.cast(db.null(), db.Integer).label("numero"), db.cast(db.null(), db.Integer).label("parcelas"),
+        db.cast(db.null(), db.Boolean).label("pago"), db.cast(db.null(), db.Integer).label("categoria_id"),
+    )
+
+    categorias = db.select(
+        db.literal("categoria").label("grupo"), Categoria.id,
+        Categoria.nome.label("descricao"), Categoria.orcamento_centavos.label("centavos"), data_nula.label("data"),
+        db.func.row_number().over(order_by=(Categoria.nome.asc(), Categoria.id.asc())).label("pos"),
+        *sem_parcela,
+    ).filter(Categoria.user_id == user_id)
+
+    alertas = db.select(
+        db.literal("alerta").label("grupo"), AlertaOrcamento.categoria_id.label("id"),
+        Categoria.nome.label("descricao"), AlertaOrcamento.gasto_centavos.label("centavos"), data_nula.label("data"),
+        db.func.row_number().over(
+            order_by=(AlertaOrcamento.nivel.desc(), Categoria.nome.asc())
+        ).label("pos"),
+        *sem_parcela,
+    ).join(Categoria, Categoria.id == AlertaOrcamento.categoria_id).filter(
+        AlertaOrcamento.user_id == user_id, AlertaOrcamento.ano == ano, AlertaOrcamento.mes == mes,
+    )
+
+    salarios = db.select(
+        db.literal("salario").label("grupo"), Transacao.id,
+        Transacao.descricao, Transacao.valor_total_centavos.label("centavos"), Transacao.data,
+        db.func.row_number().over(order_by=(Transacao.descricao.asc(), Transacao.id.asc())).label("pos"),
+        *sem_parcela,
+    ).filter(Transacao.user_id == user_id, Transacao.tipo_entrada == "salario")
+
+    entradas = db.select(
+        db.literal("entrada_manual").label("grupo"), Transacao.id,
+        Transacao.descricao, Transacao.valor_total_centavos.label("centavos"), Transacao.data,
+        db.func.row_number().over(order_by=(Transacao.data.desc(), Transacao.id.desc())).label("pos"),
+        *sem_parcela,
+    ).filter(Transacao.user_id == user_id, Transacao.tipo_entrada == "entrada_manual").subquery()
+    entradas = db.select(entradas).filter(entradas.c.pos <= limite_entradas)
+
+    listadas = db.select(_select_transacoes(Transacao, *args[:6]).subquery().c.id)
+    inicio, fim = intervalo_mes(ano, mes)
+    parcelas = db.select(
+        db.literal("parcela").label("grupo"), ParcelaAgenda.id,
+        Transacao.descricao, ParcelaAgenda.valor_centavos.label("centavos"), ParcelaAgenda.vencimento.label("data"),
+        db.func.row_number().over(order_by=(ParcelaAgenda.vencimento.asc(), ParcelaAgenda.id.asc())).label("pos"),
+        ParcelaAgenda.numero, Transacao.parcelas, ParcelaAgenda.pago, Transacao.categoria_id,
+    ).join(Transacao, ParcelaAgenda.transacao_id == Transacao.id).filter(
+        ParcelaAgenda.user_id == user_id,
+        ParcelaAgenda.transacao_id.in_(listadas),
+        ParcelaAgenda.vencimento >= inicio,
+        ParcelaAgenda.vencimento < fim,
+    )
+
+    # gráfico: parcelas na mesma situação da lista (pendentes, ou pagas na visão de pagos)
+    num_mes = db.cast(
+        db.extract("year", ParcelaAgenda.vencimento) * 12 + db.extract("month", ParcelaAgenda.vencimento) - 1,
+        db.Integer,
+    )
+    primeiro = date(ano, mes, 1)
+    por_mes = db.select(
+        db.literal("parcelas_mes").label("grupo"), num_mes.label("id"),
+        db.cast(db.null(), db.String).label("descricao"), db.func.sum(ParcelaAgenda.valor_centavos).label("centavos"),
+        data_nula.label("data"), num_mes.label("pos"), *sem_parcela,
+    ).filter(
+        ParcelaAgenda.user_id == user_id,
+        ParcelaAgenda.transacao_id.in_(listadas),
+        ParcelaAgenda.pago == mostrar_pagos,
+        ParcelaAgenda.vencimento >= adicionar_meses(primeiro, -GRAFICO_MESES_ANTES),
+        ParcelaAgenda.vencimento < adicionar_meses(primeiro, GRAFICO_MESES_DEPOIS + 1),
+    ).group_by(num_mes)
+
+    u = db.union_all(categorias, alertas, salarios, entradas, parcelas, por_mes).subquery()
+    return db.select(u).order_by(u.c.grupo, u.c.pos)
+
+
+def _separar_extras(rows) -> dict:
+    """Valores chegam em centavos (`centavos`); os objetos do template recebem reais."""
+    extras = {"categorias": [], "alertas_orcamento": [], "salarios": [], "entradas_manuais": [],
+              "parcelas_mes": [], "parcelas_por_mes": {}}
+    limites, gastos = {}, {}
+    for r in rows:
+        reais = r.centavos / 100 if r.centavos is not None else None
+        if r.grupo == "categoria":
+            limites[r.id] = r.centavos
+            extras["categorias"].append(SimpleNamespace(id=r.id, nome=r.descricao, orcamento=reais))
+        elif r.grupo == "alerta":
+            gastos[r.id] = r.centavos
+            extras["alertas_orcamento"].append(SimpleNamespace(categoria_id=r.id, nome=r.descricao, gasto=reais))
+        elif r.grupo == "parcela":
+            extras["parcelas_mes"].append(SimpleNamespace(
+                id=r.id, descricao=r.descricao, numero=r.numero, parcelas=r.parcelas, vencimento=r.data,
+                valor=reais, valor_centavos=r.centavos, pago=bool(r.pago), categoria_id=r.categoria_id,
+            ))
+        elif r.grupo == "parcelas_mes":
+            extras["parcelas_por_mes"][r.id] = abs(int(r.centavos))
+        else:
+            chave = "salarios" if r.grupo == "salario" else "entradas_manuais"
+            extras[chave].append(SimpleNamespace(
+                id=r.id, descricao=r.descricao, valor_total=reais, data=r.data,
+            ))
+
+    # "alerta" vem antes de "categoria" na ordenação: o limite é resolvido no fim
+    for a in extras["alertas_orcamento"]:
+        limite = limites.get(a.categoria_id) or 0
+        a.orcamento = limite / 100
+        a.percentual = round(gastos[a.categoria_id] * 100 / limite) if limite else 0
+    return extras
+
+
+def carregar_dashboard(user_id: int, busca: str, mostrar_pagos: bool, filtro_tipo: str,
+                       categorias_incluir: list, categorias_excluir: list, ordenar_por: str,
+                       ordem: str, ano: int, mes: int) -> dict:
+    """
+    Tudo que o GET / precisa do banco em duas consultas: a lista filtrada
+    (com o arquivo, na visão de pagos) e os "extras" (categorias, alertas de
+    orçamento do mês, salários, entradas manuais, parcelas da agenda). Com
+    ASYNC_DASHBOARD=1 as duas rodam em paralelo.
+    """
+    args = (user_id, busca, mostrar_pagos, filtro_tipo, categorias_incluir,
+            categorias_excluir, ordenar_por, ordem)
+
+    if app.config["ASYNC_DASHBOARD"]:
+        engine = _engine_async("leitura" if usar_replica() else None)
+        if engine is not None:
+            futuro = asyncio.run_coroutine_threadsafe(
+                _carregar_dashboard_async(engine, args, ano, mes), _loop_async()
+            )
+            return futuro.result()
+
+    dados = _separar_extras(db.session.execute(_select_extras(args, ano, mes)).all())
+    dados["transacoes"] = obter_transacoes_do_usuario(*args)
+    return dados
+
+
+# ---------------- Dashboard assíncrono ----------------
+# Um event loop por processo (thread daemon) mantém o pool do engine async
+# vivo entre requisições. A view continua síncrona e bloqueia esperando o
+# resultado: o ganho é só a lista e os extras rodarem ao mesmo tempo.
+_async_loop = None
+_async_engines = {}
+_async_lock = threading.Lock()
+
+DRIVERS_ASYNC = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _loop_async():
+    global _async_loop
+    with _async_lock:
+        if _async_loop is None:
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, daemon=True, name="ifinance-async").start()
+        return _async_loop
+
+
+def _engine_async(bind_key):
+    """Engine async equivalente ao bind síncrono; None (e desativa o modo) se faltar driver."""
+    with _async_lock:
+        if bind_key in _async_engines:
+            return _async_engines[bind_key]
+
+        url = db.engines[bind_key].url
+        driver = DRIVERS_ASYNC.get(url.get_backend_name())
+        try:
+            if driver is None:
+                raise ValueError(f"sem driver async para {url.get_backend_name()}")
+            from sqlalchemy.ext.asyncio import create_async_engine
+            engine = create_async_engine(url.set(drivername=driver))
+        except Exception as e:
+            app.logger.warning("ASYNC_DASHBOARD desativado: %s", e)
+            app.config["ASYNC_DASHBOARD"] = False
+            return None
+
+        _async_engines[bind_key] = engine
+        return engine
+
+
+async def _carregar_dashboard_async(engine, args, ano: int, mes: int) -> dict:
+    async def linhas(stmt):
+        async with engine.connect() as conn:
+            return (await conn.execute(stmt)).all()
+
+    lista, extras = await asyncio.gather(
+        linhas(_select_lista(*args)),
+        linhas(_select_extras(args, ano, mes)),
     )
 
+    dados = _separar_extras(extras)
+    dados["transacoes"] = _transacoes_para_dicts(lista)
+    return dados
+
 
 # ---------------- Auth ----------------
 @app.route("/register", methods=["GET", "POST"])
@@ -366,6 +1058,8 @@ def login():
             return redirect(url_for("login"))
 
         login_user(u)
+        if u.orcamentos_mes != _mes_atual():
+            enfileirar_job("reavaliar_orcamentos", u.id)
         flash("Bem-vindo de volta ✅", "ok")
         return redirect(url_for("home"))
 
@@ -501,8 +1195,25 @@ def excluir_categoria(cat_id):
         flash("Categoria não encontrada.", "error")
         return redirect(url_for("home", mes=mes, ano=ano, categoria=categoria_sel, busca=busca))
 
-    # Remove a categoria das transações
+    # Remove a categoria das transações (também das arquivadas: a FK vale nas duas)
     Transacao.query.filter_by(categoria_id=cat_id).update({"categoria_id": None})
+    TransacaoArquivo.query.filter_by(categoria_id=cat_id).update({"categoria_id": None})
+    AlertaOrcamento.query.filter_by(categoria_id=cat_id).delete()
+
+    # rollups do arquivo: os totais da categoria passam para "sem categoria" do mesmo mês
+    sem_categoria = {
+        (r.ano, r.mes): r
+        for r in ResumoMensalArquivo.query.filter_by(user_id=current_user.id, categoria_id=None)
+    }
+    for r in ResumoMensalArquivo.query.filter_by(user_id=current_user.id, categoria_id=cat_id).all():
+        destino = sem_categoria.get((r.ano, r.mes))
+        if destino is None:
+            r.categoria_id = None
+            sem_categoria[(r.ano, r.mes)] = r
+            continue
+        destino.entradas_centavos += r.entradas_centavos
+        destino.saidas_centavos += r.saidas_centavos
+        db.session.delete(r)
     db.session.delete(c)
     db.session.commit()
 
@@ -512,6 +1223,7 @@ def excluir_categoria(cat_id):
 
 # ---------------- App ----------------
 @app.route("/", methods=["GET", "POST"])
+@leitura_replica
 @login_required
 def home():
     hoje = datetime.today().date()
@@ -617,12 +1329,16 @@ def home():
         if parcelas <= 0:
             parcelas = 1
 
-        valor_parcela = valor_total / parcelas
+        # mesma descrição, valor e data já cadastrados: só salva se o usuário confirmar
+        if request.form.get("forcar_duplicada") != "1" and duplicada_exata(
+            current_user.id, descricao, para_centavos(valor_total), data_compra
+        ):
+            flash("Essa transação já foi cadastrada (mesma descrição, valor e data).", "error")
+            return redirect(url_for("home", mes=mes_sel, ano=ano_sel, categoria=categoria_raw, busca=busca))
 
         # Se for recorrente, ignora parcelas e define como 999 (infinito)
         if recorrente:
             parcelas = 999
-            valor_parcela = valor_total
 
         t = Transacao(
             user_id=current_user.id,
@@ -632,36 +1348,33 @@ def home():
             tipo=tipo,
             data=data_compra,
             parcelas=parcelas,
-            valor_parcela=valor_parcela,
             observacoes=observacoes if observacoes else None,
             recorrente=recorrente,
             tipo_entrada=tipo_entrada,
         )
+        gerar_agenda(t)
+        versao = versao_dados(current_user.id)
         db.session.add(t)
         db.session.commit()
+        depois = snapshot_transacao(t)
+        indices_apos_escrita(current_user.id, versao, None, depois)
+        avaliar_orcamentos(current_user.id, meses_tocados(None, depois))
 
         flash("Transação salva ✅", "ok")
         return redirect(url_for("home", mes=mes_sel, ano=ano_sel, categoria=categoria_raw, busca=busca))
 
-    # GET: listar
-    transacoes_todas = obter_transacoes_do_usuario(
+    # GET: listar (lista filtrada, categorias, salários e últimas entradas manuais)
+    dados = carregar_dashboard(
         current_user.id, busca, mostrar_pagos, 
         filtro_tipo, categorias_incluir, categorias_excluir,
-        ordenar_por, ordem
+        ordenar_por, ordem, ano_sel, mes_sel
     )
-    categorias = listar_categorias(current_user.id)
-
-    # Listar salários (separado)
-    salarios = Transacao.query.filter_by(
-        user_id=current_user.id, 
-        tipo_entrada="salario"
-    ).order_by(Transacao.descricao.asc()).all()
-
-    # Listar entradas manuais (apenas as do tipo entrada_manual)
-    entradas_manuais = Transacao.query.filter(
-        Transacao.user_id == current_user.id,
-        Transacao.tipo_entrada == "entrada_manual"
-    ).order_by(Transacao.data.desc()).limit(10).all()
+    transacoes_todas = dados["transacoes"]
+    categorias = dados["categorias"]
+    salarios = dados["salarios"]
+    entradas_manuais = dados["entradas_manuais"]
+    alertas_orcamento = dados["alertas_orcamento"]
+    parcelas_mes = dados["parcelas_mes"]
 
     # Paginação
     itens_por_pagina = 25
@@ -680,15 +1393,24 @@ def home():
     anos_dropdown = list(range(ano_min, ano_max + 1))
     meses_dropdown = list(range(1, 13))
 
-    # Calcular resumo com TODAS as transações (não paginadas)
-    total_entradas, total_saidas_normal, saldo = calcular_resumo_mes(transacoes_todas, ano_sel, mes_sel)
-    total_saidas_categoria = calcular_saidas_categoria_mes(transacoes_todas, ano_sel, mes_sel, categoria_sel)
+    # Calcular resumo com TODAS as transações (não paginadas); parcelas vêm da agenda,
+    # na mesma situação da lista (pendentes, ou pagas na visão de pagos)
+    parcelas_na_lista = [p for p in parcelas_mes if p.pago == mostrar_pagos]
+    total_entradas, total_saidas_normal, saldo = calcular_resumo_mes(
+        transacoes_todas, ano_sel, mes_sel, sum(abs(p.valor_centavos) for p in parcelas_na_lista)
+    )
+    total_saidas_categoria = calcular_saidas_categoria_mes(
+        transacoes_todas, ano_sel, mes_sel, categoria_sel,
+        sum(abs(p.valor_centavos) for p in parcelas_na_lista if p.categoria_id == categoria_sel),
+    )
 
     # ✅ card vermelho mostra categoria se selecionada, senão normal
     total_saidas = total_saidas_categoria if categoria_sel is not None else total_saidas_normal
 
     # Gráfico com TODAS as transações
-    graf_labels, graf_entradas, graf_despesas = calcular_grafico(transacoes_todas, ano_sel, mes_sel)
+    graf_labels, graf_entradas, graf_despesas = calcular_grafico(
+        transacoes_todas, ano_sel, mes_sel, dados["parcelas_por_mes"]
+    )
 
     return render_template(
         "index.html",
@@ -723,6 +1445,8 @@ def home():
 
         salarios=salarios,
         entradas_manuais=entradas_manuais,
+        alertas_orcamento=alertas_orcamento,
+        parcelas_mes=parcelas_mes,
     )
 
 
@@ -730,11 +1454,18 @@ def home():
 @login_required
 def remover(item_id):
     t = Transacao.query.filter_by(id=item_id, user_id=current_user.id).first()
-    if not t:
+    if not t and TransacaoArquivo.query.filter_by(id=item_id, user_id=current_user.id).first():
+        flash("Essa transação está arquivada e não pode ser alterada.", "error")
+    elif not t:
         flash("Não encontrei essa transação (ou não é sua).", "error")
     else:
+        antes = snapshot_transacao(t)
+        versao = versao_dados(current_user.id)
+        db.session.add(TransacaoRemovida(transacao_id=t.id, user_id=t.user_id))
         db.session.delete(t)
         db.session.commit()
+        indices_apos_escrita(current_user.id, versao, antes, None)
+        avaliar_orcamentos(current_user.id, meses_tocados(antes, None))
         flash("Transação removida ✅", "ok")
 
     mes = request.args.get("mes", "")
@@ -748,10 +1479,16 @@ def remover(item_id):
 @login_required
 def editar(item_id):
     t = Transacao.query.filter_by(id=item_id, user_id=current_user.id).first()
+    if not t and TransacaoArquivo.query.filter_by(id=item_id, user_id=current_user.id).first():
+        flash("Essa transação está arquivada e não pode ser alterada.", "error")
+        return redirect(url_for("home", pagos="1"))
     if not t:
         flash("Não encontrei essa transação (ou não é sua).", "error")
         return redirect(url_for("home"))
 
+    antes = snapshot_transacao(t)
+    # antes de mexer em `t`: carregar t.agenda faz autoflush do UPDATE e a versão já viria nova
+    versao = versao_dados(current_user.id)
     mes_sel = request.args.get("mes", "")
     ano_sel = request.args.get("ano", "")
     busca = request.args.get("busca", "")
@@ -804,21 +1541,21 @@ def editar(item_id):
     # Se for recorrente, ajusta parcelas
     if recorrente:
         parcelas = 999
-        valor_parcela = valor_total
-    else:
-        valor_parcela = valor_total / parcelas
 
     t.descricao = descricao
     t.valor_total = valor_total
     t.tipo = tipo
     t.data = data_compra
     t.parcelas = parcelas
-    t.valor_parcela = valor_parcela
     t.categoria_id = categoria_id
     t.observacoes = observacoes if observacoes else None
     t.recorrente = recorrente
+    gerar_agenda(t)
 
     db.session.commit()
+    depois = snapshot_transacao(t)
+    indices_apos_escrita(current_user.id, versao, antes, depois)
+    avaliar_orcamentos(current_user.id, meses_tocados(antes, depois))
     flash("Transação atualizada ✅", "ok")
 
     return redirect(url_for("home", mes=mes_sel, ano=ano_sel, categoria=categoria, busca=busca))
@@ -870,7 +1607,6 @@ def cadastrar_salario():
         tipo="entrada",
         data=data_inicio,
         parcelas=999,  # Infinito
-        valor_parcela=valor,
         recorrente=True,
         tipo_entrada="salario",
     )
@@ -888,6 +1624,7 @@ def excluir_salario(item_id):
     if not t:
         flash("Salário não encontrado.", "error")
     else:
+        db.session.add(TransacaoRemovida(transacao_id=t.id, user_id=t.user_id))
         db.session.delete(t)
         db.session.commit()
         flash("Salário excluído ✅", "ok")
@@ -903,6 +1640,7 @@ def marcar_pago(item_id):
         flash("Não encontrei essa transação (ou não é sua).", "error")
     else:
         t.pago = True
+        ParcelaAgenda.query.filter_by(transacao_id=t.id).update({"pago": True})
         db.session.commit()
         flash("Transação marcada como paga ✅", "ok")
 
@@ -913,58 +1651,1977 @@ def marcar_pago(item_id):
     return redirect(url_for("home", mes=mes, ano=ano, categoria=categoria, busca=busca))
 
 
+# ---------------- Agenda de parcelas ----------------
+@app.route("/parcelas")
+@leitura_replica
+@login_required
+def listar_parcelas():
+    hoje = datetime.today().date()
+    try:
+        mes = int(request.args.get("mes", hoje.month))
+        ano = int(request.args.get("ano", hoje.year))
+        if not 1 <= mes <= 12:
+            raise ValueError
+    except ValueError:
+        mes, ano = hoje.month, hoje.year
+
+    somente_pendentes = request.args.get("pendentes", "") == "1"
+    rows = parcelas_do_mes(current_user.id, ano, mes, somente_pendentes)
+
+    return jsonify({
+        "mes": mes,
+        "ano": ano,
+        "total": total_parcelas_mes(current_user.id, ano, mes, somente_pendentes),
+        "total_pendente": total_parcelas_mes(current_user.id, ano, mes, somente_pendentes=True),
+        "parcelas": [
+            {
+                "id": p.id,
+                "transacao_id": p.transacao_id,
+                "descricao": descricao,
+                "numero": p.numero,
+                "parcelas": parcelas,
+                "vencimento": p.vencimento.isoformat(),
+                "valor": p.valor,
+                "pago": p.pago,
+            }
+            for p, descricao, parcelas in rows
+        ],
+    })
+
+
+@app.route("/parcelas/<int:parcela_id>/pagar", methods=["POST"])
+@login_required
+def pagar_parcela(parcela_id):
+    p = ParcelaAgenda.query.filter_by(id=parcela_id, user_id=current_user.id).first()
+    if not p:
+        flash("Parcela não encontrada.", "error")
+    else:
+        p.pago = True
+        # última parcela quitada -> a compra inteira fica paga
+        pendentes = ParcelaAgenda.query.filter(
+            ParcelaAgenda.transacao_id == p.transacao_id,
+            ParcelaAgenda.pago == False,
+            ParcelaAgenda.id != p.id,
+        ).count()
+        if pendentes == 0:
+            Transacao.query.filter_by(id=p.transacao_id).update({"pago": True})
+        db.session.commit()
+        flash(f"Parcela {p.numero} marcada como paga ✅", "ok")
+
+    mes = request.args.get("mes", "")
+    ano = request.args.get("ano", "")
+    busca = request.args.get("busca", "")
+    categoria = request.args.get("categoria", "")
+    return redirect(url_for("home", mes=mes, ano=ano, categoria=categoria, busca=busca))
+
+
+# ---------------- Arquivamento ----------------
+def meses_da_transacao(t):
+    """(ano, mes, entrada, saida) em centavos de cada mês em que a transação (não recorrente) pesa."""
+    if t.valor_total_centavos > 0:
+        return [(t.data.year, t.data.month, t.valor_total_centavos, 0)]
+    parcelas = max(int(t.parcelas or 1), 1)
+    meses = []
+    for i in range(parcelas):
+        d = adicionar_meses(t.data, i)
+        meses.append((d.year, d.month, 0, abs(parcela_centavos(t.valor_total_centavos, parcelas, i))))
+    return meses
+
+
+def arquivar_transacoes(meses: int | None = None, user_id: int | None = None, lote: int = 500) -> int:
+    """
+    Move para transacoes_arquivo as transações pagas, não recorrentes, cuja última
+    parcela venceu antes do corte (hoje - `meses`). Os totais mensais são somados em
+    resumos_mensais_arquivo antes de mover. Processa em lotes; devolve quantas moveu.
+    """
+    meses = app.config["ARQUIVO_MESES"] if meses is None else meses
+    corte = adicionar_meses(date.today().replace(day=1), -meses)
+    total = 0
+    ultimo_id = 0
+
+    while True:
+        q = Transacao.query.filter(
+            Transacao.pago == True,
+            Transacao.recorrente == False,
+            Transacao.data < corte,
+            Transacao.id > ultimo_id,
+        )
+        if user_id is not None:
+            q = q.filter(Transacao.user_id == user_id)
+        candidatas = q.order_by(Transacao.id.asc()).limit(lote).all()
+        if not candidatas:
+            break
+        ultimo_id = candidatas[-1].id
+
+        # totalmente encerradas: a última parcela também é anterior ao corte
+        elegiveis = [
+            t for t in candidatas
+            if adicionar_meses(t.data, max(int(t.parcelas or 1), 1) - 1) < corte
+        ]
+        if not elegiveis:
+            continue
+
+        # 1) rollup mensal
+        deltas = {}
+        for t in elegiveis:
+            for ano, mes, ent, sai in meses_da_transacao(t):
+                d = deltas.setdefault((t.user_id, ano, mes, t.categoria_id), [0, 0])
+                d[0] += ent
+                d[1] += sai
+
+        usuarios = {k[0] for k in deltas}
+        existentes = {
+            (r.user_id, r.ano, r.mes, r.categoria_id): r
+            for r in ResumoMensalArquivo.query.filter(ResumoMensalArquivo.user_id.in_(usuarios)).all()
+        }
+        for chave, (ent, sai) in deltas.items():
+            r = existentes.get(chave)
+            if r is None:
+                r = ResumoMensalArquivo(user_id=chave[0], ano=chave[1], mes=chave[2],
+                                        categoria_id=chave[3], entradas_centavos=0, saidas_centavos=0)
+                db.session.add(r)
+            r.entradas_centavos += ent
+            r.saidas_centavos += sai
+
+        # 2) copia para o arquivo e remove da tabela quente
+        ids = [t.id for t in elegiveis]
+        db.session.bulk_insert_mappings(TransacaoArquivo, [
+            {
+                "id": t.id, "user_id": t.user_id, "categoria_id": t.categoria_id,
+                "descricao": t.descricao, "tipo": t.tipo, "data": t.data, "parcelas": t.parcelas,
+                "valor_total_centavos": t.valor_total_centavos,
+                "valor_parcela_centavos": t.valor_parcela_centavos,
+                "observacoes": t.observacoes, "pago": True, "recorrente": False,
+                "tipo_entrada": t.tipo_entrada, "fingerprint": t.fingerprint,
+                "hash_importacao": t.hash_importacao,
+                "created_at": t.created_at,
+            }
+            for t in elegiveis
+        ])
+        ParcelaAgenda.query.filter(ParcelaAgenda.transacao_id.in_(ids)).delete(synchronize_session=False)
+        Transacao.query.filter(Transacao.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+
+    return total
+
+
+# ---------------- Sincronização incremental ----------------
+app.config["SYNC_MARGEM_SEGUNDOS"] = 5  # reenvia os últimos segundos (commits atrasados)
+app.config["SYNC_LIMITE"] = 1000
+
+
+def _formatar_cursor(ts: datetime, ultimo_id: int = 0) -> str:
+    return f"{ts.isoformat()}_{ultimo_id}"
+
+
+def _ler_cursor(cursor: str) -> tuple[datetime, int]:
+    ts, _, ultimo_id = cursor.partition("_")
+    return datetime.fromisoformat(ts), int(ultimo_id or 0)
+
+
+def _transacao_sync(t: Transacao) -> dict:
+    return {
+        "id": t.id,
+        "descricao": t.descricao,
+        "valor_total": t.valor_total,
+        "tipo": t.tipo,
+        "data": t.data.isoformat(),
+        "parcelas": t.parcelas,
+        "valor_parcela": t.valor_parcela,
+        "valor_total_centavos": t.valor_total_centavos,
+        "valor_parcela_centavos": t.valor_parcela_centavos,
+        "categoria_id": t.categoria_id,
+        "observacoes": t.observacoes,
+        "pago": t.pago,
+        "recorrente": t.recorrente,
+        "tipo_entrada": t.tipo_entrada,
+        "updated_at": t.updated_at.isoformat() if getattr(t, "updated_at", None) else None,
+        "arquivada": isinstance(t, TransacaoArquivo),
+    }
+
+
+def _ler_cursor_sync(cursor: str) -> tuple[str, datetime | None, int, str | None]:
+    """
+    (fase, desde, desde_id, final). Sem cursor é o início da carga completa; "ts_id"
+    é delta; "completa~ts_id" continua a carga completa em `transacoes`;
+    "arquivo~ts_id~final" pagina o arquivo e devolve `final` (cursor de delta) no fim.
+    """
+    if not cursor:
+        return "completa", None, 0, None
+    partes = cursor.split("~")
+    if len(partes) == 1:
+        return ("delta", *_ler_cursor(partes[0]), None)
+    if partes[0] == "completa" and len(partes) == 2:
+        return ("completa", *_ler_cursor(partes[1]), None)
+    if partes[0] == "arquivo" and len(partes) == 3:
+        _ler_cursor(partes[2])
+        return ("arquivo", *_ler_cursor(partes[1]), partes[2])
+    raise ValueError(cursor)
+
+
+def _pagina_keyset(q, coluna_ts, coluna_id, desde: datetime | None, desde_id: int, limite: int):
+    """Uma página ordenada por (ts, id) depois de (desde, desde_id); devolve (linhas, mais)."""
+    if desde is not None:
+        q = q.filter((coluna_ts > desde) | ((coluna_ts == desde) & (coluna_id > desde_id)))
+    linhas = q.order_by(coluna_ts.asc(), coluna_id.asc()).limit(limite + 1).all()
+    return linhas[:limite], len(linhas) > limite
+
+
+@app.route("/api/sync")
+@leitura_replica
+@login_required
+def api_sync():
+    """
+    Devolve só o que mudou desde `cursor` (criado/alterado em `transacoes`,
+    ids removidos). Sem cursor: carga completa, primeiro `transacoes` e depois
+    as arquivadas. Tudo paginado por (updated_at, id) / (arquivado_em, id);
+    com "mais": true, chame de novo com o cursor.
+    """
+    agora = datetime.utcnow()
+    limite = app.config["SYNC_LIMITE"]
+    cursor = (request.args.get("cursor") or "").strip()
+
+    try:
+        fase, desde, desde_id, final = _ler_cursor_sync(cursor)
+    except ValueError:
+        return jsonify({"erro": "Cursor inválido."}), 400
+
+    if fase == "arquivo":
+        # as arquivadas não mudam mais: quem for arquivado durante a carga já veio de `transacoes`
+        linhas, mais = _pagina_keyset(
+            TransacaoArquivo.query.filter(TransacaoArquivo.user_id == current_user.id),
+            TransacaoArquivo.arquivado_em, TransacaoArquivo.id, desde, desde_id, limite,
+        )
+        return jsonify({
+            "transacoes": [_transacao_sync(t) for t in linhas],
+            "removidas": [],
+            "mais": mais,
+            "cursor": f"arquivo~{_formatar_cursor(linhas[-1].arquivado_em, linhas[-1].id)}~{final}" if mais else final,
+        })
+
+    linhas, mais = _pagina_keyset(
+        Transacao.query.filter(Transacao.user_id == current_user.id),
+        Transacao.updated_at, Transacao.id, desde, desde_id, limite,
+    )
+    resposta = {"transacoes": [_transacao_sync(t) for t in linhas], "removidas": [], "mais": mais}
+
+    if mais:
+        resposta["cursor"] = _formatar_cursor(linhas[-1].updated_at, linhas[-1].id)
+        if fase == "completa":
+            resposta["cursor"] = "completa~" + resposta["cursor"]
+    else:
+        # última página: o próximo cursor volta alguns segundos (sem passar do atual)
+        proximo = agora - timedelta(seconds=app.config["SYNC_MARGEM_SEGUNDOS"])
+        if desde is not None and desde >= proximo:
+            resposta["cursor"] = _formatar_cursor(desde, desde_id)
+        else:
+            resposta["cursor"] = _formatar_cursor(proximo)
+        if fase == "completa":
+            # carga completa: falta o arquivo, que devolve este cursor de delta na última página
+            resposta["mais"] = True
+            resposta["cursor"] = f"arquivo~{_formatar_cursor(datetime.min)}~{resposta['cursor']}"
+
+    if fase == "delta":
+        resposta["removidas"] = [
+            r.transacao_id
+            for r in TransacaoRemovida.query.filter(
+                TransacaoRemovida.user_id == current_user.id,
+                TransacaoRemovida.removido_em >= desde,
+            ).all()
+        ]
+
+    return jsonify(resposta)
+
+
+# ---------------- Índices em memória por usuário ----------------
+# Estruturas derivadas do histórico do usuário (categorização, autocomplete...)
+# ficam em cache no processo, carimbadas com a versão dos dados. Escritas feitas
+# por este processo atualizam o índice incrementalmente; escritas de outros
+# workers mudam a versão e o índice é reconstruído na próxima leitura.
+# Um índice em cache nunca é alterado: quem o recebeu de indice_usuario lê sem
+# lock, e cada escrita troca a entrada por uma cópia já atualizada.
+CACHE_MAX_USUARIOS = 256
+INDICES_USUARIO = {}  # nome -> (construir(user_id), aplicar(valor, antes, depois))
+_cache_usuarios = OrderedDict()  # (nome, user_id) -> (versao, valor)
+_cache_lock = threading.Lock()
+
+
+def registrar_indice(nome: str, construir, aplicar=None):
+    INDICES_USUARIO[nome] = (construir, aplicar)
+
+
+def versao_dados(user_id: int) -> tuple:
+    """(quantidade, maior updated_at) das transações: muda a cada insert/update/delete."""
+    with db.session.no_autoflush:
+        n, ultimo = (
+            db.session.query(db.func.count(Transacao.id), db.func.max(Transacao.updated_at))
+            .filter(Transacao.user_id == user_id)
+            .one()
+        )
+    return (n, ultimo)
+
+
+def indice_usuario(nome: str, user_id: int):
+    versao = versao_dados(user_id)
+    chave = (nome, user_id)
+    with _cache_lock:
+        item = _cache_usuarios.get(chave)
+        if item is not None and item[0] == versao:
+            _cache_usuarios.move_to_end(chave)
+            return item[1]
+
+    valor = INDICES_USUARIO[nome][0](user_id)
+    with _cache_lock:
+        _cache_usuarios[chave] = (versao, valor)
+        _cache_usuarios.move_to_end(chave)
+        while len(_cache_usuarios) > CACHE_MAX_USUARIOS:
+            _cache_usuarios.popitem(last=False)
+    return valor
+
+
+def indices_apos_escrita(user_id: int, versao_antes: tuple, antes: dict | None, depois: dict | None):
+    """
+    Chamado após o commit de uma escrita deste processo. Se o índice estava na
+    versão anterior à escrita, aplica a mudança numa cópia e a carimba com a nova
+    versão; senão (ficou velho por escrita de outro worker) só descarta. Se outra
+    thread trocou a entrada enquanto a cópia era atualizada, descarta também.
+    """
+    versao_depois = None
+    for nome, (_, aplicar) in INDICES_USUARIO.items():
+        chave = (nome, user_id)
+        with _cache_lock:
+            item = _cache_usuarios.get(chave)
+            if item is None:
+                continue
+            if aplicar is None or item[0] != versao_antes:
+                del _cache_usuarios[chave]
+                continue
+        novo = copy.deepcopy(item[1])
+        aplicar(novo, antes, depois)
+        if versao_depois is None:
+            versao_depois = versao_dados(user_id)
+        with _cache_lock:
+            if _cache_usuarios.get(chave) is item:
+                _cache_usuarios[chave] = (versao_depois, novo)
+            else:
+                _cache_usuarios.pop(chave, None)
+
+
+def snapshot_transacao(t) -> dict:
+    return {
+        "id": t.id,
+        "descricao": t.descricao,
+        "data": t.data,
+        "parcelas": t.parcelas,
+        "valor_total_centavos": t.valor_total_centavos,
+        "valor_parcela_centavos": t.valor_parcela_centavos,
+        "categoria_id": t.categoria_id,
+        "recorrente": t.recorrente,
+        "tipo_entrada": t.tipo_entrada,
+        "pago": t.pago,
+    }
+
+
+# ---------------- Categorização automática ----------------
+_RE_NAO_ALFANUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar_descricao(descricao: str) -> str:
+    """'Calça  TNB!' -> 'calca tnb'"""
+    s = unicodedata.normalize("NFKD", descricao.lower())
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return _RE_NAO_ALFANUM.sub(" ", s).strip()
+
+
+def tokens_descricao(normalizada: str) -> list[str]:
+    return [w for w in normalizada.split() if len(w) >= 2 and not w.isdigit()]
+
+
+def _construir_categorizacao(user_id: int) -> dict:
+    indice = {"exato": {}, "tokens": {}}
+    for M in (Transacao, TransacaoArquivo):
+        q = (
+            db.session.query(M.descricao, M.categoria_id)
+            .filter(M.user_id == user_id, M.categoria_id != None)
+            .execution_options(yield_per=5000)
+        )
+        for descricao, categoria_id in q:
+            _votar_categoria(indice, descricao, categoria_id, 1)
+    return indice
+
+
+def _votar_categoria(indice: dict, descricao: str, categoria_id: int, peso: int):
+    norm = normalizar_descricao(descricao)
+    alvos = [(indice["exato"], norm)] + [(indice["tokens"], tok) for tok in set(tokens_descricao(norm))]
+    for mapa, chave in alvos:
+        contador = mapa.setdefault(chave, Counter())
+        contador[categoria_id] += peso
+        if contador[categoria_id] <= 0:
+            del contador[categoria_id]
+            if not contador:
+                del mapa[chave]
+
+
+def _aplicar_categorizacao(indice: dict, antes: dict | None, depois: dict | None):
+    if antes and antes["categoria_id"] is not None:
+        _votar_categoria(indice, antes["descricao"], antes["categoria_id"], -1)
+    if depois and depois["categoria_id"] is not None:
+        _votar_categoria(indice, depois["descricao"], depois["categoria_id"], 1)
+
+
+registrar_indice("categorizacao", _construir_categorizacao, _aplicar_categorizacao)
+
+
+def sugerir_categoria(indice: dict, descricao: str) -> tuple[int | None, float]:
+    """(categoria_id, confiança 0-1) pela descrição exata ou, se não houver, por votos dos tokens."""
+    norm = normalizar_descricao(descricao)
+    exato = indice["exato"].get(norm)
+    if exato:
+        categoria_id, n = exato.most_common(1)[0]
+        return categoria_id, n / exato.total()
+
+    tokens = tokens_descricao(norm)
+    votos = Counter()
+    for tok in tokens:
+        contador = indice["tokens"].get(tok)
+        if contador:
+            total = contador.total()
+            for categoria_id, n in contador.items():
+                votos[categoria_id] += n / total
+    if not votos:
+        return None, 0.0
+    categoria_id, pontos = votos.most_common(1)[0]
+    return categoria_id, pontos / len(tokens)
+
+
+@app.route("/api/categoria_sugerida")
+@leitura_replica
+@login_required
+def api_categoria_sugerida():
+    descricao = (request.args.get("descricao") or "").strip()
+    if not descricao:
+        return jsonify({"categoria_id": None, "categoria_nome": None, "confianca": 0.0})
+
+    categoria_id, confianca = sugerir_categoria(indice_usuario("categorizacao", current_user.id), descricao)
+    c = Categoria.query.filter_by(id=categoria_id, user_id=current_user.id).first() if categoria_id else None
+    return jsonify({
+        "categoria_id": c.id if c else None,
+        "categoria_nome": c.nome if c else None,
+        "confianca": round(confianca, 2) if c else 0.0,
+    })
+
+
+# ---------------- Detecção de duplicadas ----------------
+DUPLICADA_DIAS = 3           # janela de datas da checagem aproximada
+DUPLICADA_TOLERANCIA = 0.05  # diferença relativa de valor aceita
+
+
+def fingerprint_transacao(descricao: str, valor_total_centavos: int, data_ref: date) -> str:
+    # valor como é gravado (centavos), não pelo float do form
+    chave = f"{normalizar_descricao(descricao)}|{valor_total_centavos / 100:.2f}|{data_ref.isoformat()}"
+    return hashlib.sha1(chave.encode("utf-8")).hexdigest()
+
+
+def duplicada_exata(user_id: int, descricao: str, valor_total_centavos: int, data_ref: date,
+                    ignorar_id: int | None = None):
+    """Busca O(1) pelo índice (user_id, fingerprint)."""
+    q = Transacao.query.filter(
+        Transacao.user_id == user_id,
+        Transacao.fingerprint == fingerprint_transacao(descricao, valor_total_centavos, data_ref),
+    )
+    if ignorar_id is not None:
+        q = q.filter(Transacao.id != ignorar_id)
+    return q.first()
+
+
+def possiveis_duplicadas(user_id: int, descricao: str, valor_total_centavos: int, data_ref: date,
+                         ignorar_id: int | None = None, limite: int = 5) -> list:
+    """
+    Transações com data a ±DUPLICADA_DIAS, valor a ±DUPLICADA_TOLERANCIA e
+    descrição parecida (mesmos tokens em pelo menos metade). Usa o índice (user_id, data).
+    """
+    margem = round(abs(valor_total_centavos) * DUPLICADA_TOLERANCIA)
+    q = Transacao.query.filter(
+        Transacao.user_id == user_id,
+        Transacao.data.between(data_ref - timedelta(days=DUPLICADA_DIAS), data_ref + timedelta(days=DUPLICADA_DIAS)),
+        Transacao.valor_total_centavos.between(valor_total_centavos - margem, valor_total_centavos + margem),
+    )
+    if ignorar_id is not None:
+        q = q.filter(Transacao.id != ignorar_id)
+
+    tokens = set(tokens_descricao(normalizar_descricao(descricao)))
+    parecidas = []
+    for t in q.limit(50).all():
+        outros = set(tokens_descricao(normalizar_descricao(t.descricao)))
+        if tokens == outros or (tokens and outros and len(tokens & outros) / len(tokens | outros) >= 0.5):
+            parecidas.append(t)
+            if len(parecidas) >= limite:
+                break
+    return parecidas
+
+
+@app.route("/api/duplicadas")
+@login_required
+def api_duplicadas():
+    descricao = (request.args.get("descricao") or "").strip()
+    tipo = request.args.get("tipo", "saida")
+    try:
+        valor_total = float(request.args.get("valor", ""))
+        data_ref = datetime.strptime(request.args.get("data", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"erro": "Informe valor e data."}), 400
+    centavos = para_centavos(-abs(valor_total) if tipo == "saida" else abs(valor_total))
+
+    ignorar = request.args.get("ignorar", "")
+    ignorar_id = int(ignorar) if ignorar.isdigit() else None
+
+    def resumo(t):
+        return {"id": t.id, "descricao": t.descricao, "valor_total": t.valor_total, "data": t.data.isoformat()}
+
+    exata = duplicada_exata(current_user.id, descricao, centavos, data_ref, ignorar_id)
+    parecidas = [
+        t for t in possiveis_duplicadas(current_user.id, descricao, centavos, data_ref, ignorar_id)
+        if not exata or t.id != exata.id
+    ]
+    return jsonify({"exata": resumo(exata) if exata else None, "parecidas": [resumo(t) for t in parecidas]})
+
+
+# ---------------- Autocomplete de descrições ----------------
+# Índice de prefixos: lista ordenada das descrições normalizadas (busca com
+# bisect) + dados da última vez que cada uma foi usada (a transação de maior id;
+# o arquivo guarda o id da original, então vale entre as duas tabelas).
+def _consulta_sugestoes(M, user_id: int):
+    return (
+        db.session.query(M.id, M.descricao, M.valor_total_centavos, M.parcelas, M.categoria_id, M.recorrente)
+        .filter(M.user_id == user_id, (M.tipo_entrada == None) | (M.tipo_entrada != "salario"))
+    )
+
+
+def _construir_sugestoes(user_id: int) -> dict:
+    indice = {"user_id": user_id, "chaves": [], "entradas": {}}
+    for M in (TransacaoArquivo, Transacao):
+        q = _consulta_sugestoes(M, user_id).order_by(M.id.asc()).execution_options(yield_per=5000)
+        for r in q:
+            _registrar_uso(indice, r._mapping, 1, inserir_chave=False)
+    indice["chaves"] = sorted(indice["entradas"])
+    return indice
+
+
+def _ultimo_uso(user_id: int, norm: str, abaixo_de: int):
+    """A transação mais recente (maior id < `abaixo_de`) cuja descrição normaliza para `norm`."""
+    ultimo = None
+    for M in (Transacao, TransacaoArquivo):
+        q = _consulta_sugestoes(M, user_id).filter(M.id < abaixo_de)
+        if ultimo is not None:
+            q = q.filter(M.id > ultimo["id"])
+        q = q.order_by(M.id.desc()).execution_options(yield_per=500)
+        ultimo = next((r._mapping for r in q if normalizar_descricao(r.descricao) == norm), ultimo)
+    return ultimo
+
+
+def _dados_uso(t) -> dict:
+    return {
+        "id": t["id"],
+        "descricao": t["descricao"],
+        "valor_total_centavos": t["valor_total_centavos"],
+        "parcelas": 1 if t["recorrente"] else t["parcelas"],
+        "recorrente": bool(t["recorrente"]),
+        "categoria_id": t["categoria_id"],
+    }
+
+
+def _registrar_uso(indice: dict, t, peso: int, inserir_chave: bool = True, reler: bool = True):
+    norm = normalizar_descricao(t["descricao"])
+    if not norm:
+        return
+    e = indice["entradas"].get(norm)
+
+    if peso < 0:
+        if e is None:
+            return
+        e["frequencia"] -= 1
+        if e["frequencia"] <= 0:
+            del indice["entradas"][norm]
+            i = bisect.bisect_left(indice["chaves"], norm)
+            if i < len(indice["chaves"]) and indice["chaves"][i] == norm:
+                del indice["chaves"][i]
+        elif reler and e["id"] == t["id"]:
+            # saiu a última vez usada: os dados passam a ser os da anterior, lida do banco
+            ultimo = _ultimo_uso(indice["user_id"], norm, t["id"])
+            if ultimo is not None:
+                e.update(_dados_uso(ultimo))
+        return
+
+    if e is None:
+        e = indice["entradas"][norm] = {"frequencia": 0, "id": t["id"]}
+        if inserir_chave:
+            bisect.insort(indice["chaves"], norm)
+    e["frequencia"] += 1
+    if t["id"] >= e["id"]:
+        e.update(_dados_uso(t))
+
+
+def _aplicar_sugestoes(indice: dict, antes: dict | None, depois: dict | None):
+    depois_conta = bool(depois) and depois["tipo_entrada"] != "salario"
+    if antes and antes["tipo_entrada"] != "salario":
+        # editada sem mudar de descrição: o +1 abaixo já traz os dados novos
+        norm = normalizar_descricao(antes["descricao"])
+        mesma_chave = depois_conta and normalizar_descricao(depois["descricao"]) == norm
+        _registrar_uso(indice, antes, -1, reler=not mesma_chave)
+    if depois_conta:
+        _registrar_uso(indice, depois, 1)
+
+
+registrar_indice("sugestoes", _construir_sugestoes, _aplicar_sugestoes)
+
+
+def buscar_sugestoes(indice: dict, prefixo: str, limite: int = 8) -> list[dict]:
+    """Top `limite` descrições mais frequentes que começam com `prefixo`."""
+    norm = normalizar_descricao(prefixo)
+    if not norm:
+        return []
+    chaves = indice["chaves"]
+    inicio = bisect.bisect_left(chaves, norm)
+    fim = bisect.bisect_left(chaves, norm + "\uffff", inicio)
+    entradas = indice["entradas"]
+    melhores = heapq.nlargest(limite, chaves[inicio:fim], key=lambda k: entradas[k]["frequencia"])
+    return [entradas[k] for k in melhores]
+
+
+@app.route("/api/sugestoes")
+@leitura_replica
+@login_required
+def api_sugestoes():
+    q = (request.args.get("q") or "").strip()
+    try:
+        limite = min(max(int(request.args.get("limite", 8)), 1), 20)
+    except ValueError:
+        limite = 8
+
+    sugestoes = buscar_sugestoes(indice_usuario("sugestoes", current_user.id), q, limite)
+    nomes = {c.id: c.nome for c in listar_categorias(current_user.id)} if sugestoes else {}
+
+    return jsonify([
+        {
+            "descricao": e["descricao"],
+            "valor_total": e["valor_total_centavos"] / 100,
+            "parcelas": e["parcelas"],
+            "recorrente": e["recorrente"],
+            "categoria_id": e["categoria_id"] if e["categoria_id"] in nomes else None,
+            "categoria_nome": nomes.get(e["categoria_id"]),
+            "frequencia": e["frequencia"],
+        }
+        for e in sugestoes
+    ])
+
+
+# ---------------- Relatórios por período ----------------
+# Somas de prefixo mensais de entradas e saídas (total e por categoria), em centavos. Mesma
+# regra de calcular_projecao: parcelas caem mês a mês e recorrentes (mensalidades e salários)
+# valem todo mês a partir do início. O total de qualquer intervalo de meses é P[fim+1] - P[ini].
+# Depois do último mês do array só sobram as recorrentes, então o fluxo é constante (`taxa`).
+# O array cobre no máximo hoje ± RELATORIO_JANELA_MESES: o que cai fora (datas como 0202 ou
+# 9999) fica em trechos soltos por série ("antes"/"depois"), somados na hora da consulta.
+RELATORIO_MAX_MESES = 600
+RELATORIO_JANELA_MESES = 600
+
+
+def _num_mes(ano: int, mes: int) -> int:
+    return ano * 12 + mes - 1
+
+
+def _contribuicoes(t: dict):
+    """
+    (categoria_id, 'entradas'|'saidas', mês inicial, mês final ou None se recorrente,
+    centavos por mês). Parcelas com centavo a mais (ver parcela_centavos) saem num intervalo próprio.
+    """
+    ini = _num_mes(t["data"].year, t["data"].month)
+    total = t["valor_total_centavos"]
+    if total > 0 and t["recorrente"]:
+        yield t["categoria_id"], "entradas", ini, None, t["valor_parcela_centavos"]
+    elif total > 0:
+        yield t["categoria_id"], "entradas", ini, ini, total
+    elif total < 0 and t["recorrente"]:
+        yield t["categoria_id"], "saidas", ini, None, abs(t["valor_parcela_centavos"])
+    elif total < 0:
+        parcelas = max(int(t["parcelas"] or 1), 1)
+        base, resto = divmod(abs(total), parcelas)
+        if resto:
+            yield t["categoria_id"], "saidas", ini, ini + resto - 1, base + 1
+        if base:
+            yield t["categoria_id"], "saidas", ini + resto, ini + parcelas - 1, base
+
+
+def _serie_vazia(n: int) -> dict:
+    return {"p": [0] * (n + 1), "taxa": 0, "antes": [], "depois": []}
+
+
+def _relatorio_vazio(base: int) -> dict:
+    atual = _mes_atual()
+    limites = (atual - RELATORIO_JANELA_MESES, atual + RELATORIO_JANELA_MESES)
+    base = min(max(base, limites[0]), limites[1])
+    return {"base": base, "n": 1, "limites": limites, "series": {}}
+
+
+def _dividir_contribuicao(indice: dict, ini: int, fim: int | None):
+    """Partes de [ini, fim] antes, dentro e depois do array (None se vazias); recorrente dentro segue na `taxa`."""
+    base, ultimo = indice["base"], indice["base"] + indice["n"] - 1
+    antes = (ini, base - 1 if fim is None else min(fim, base - 1)) if ini < base else None
+    if fim is None:
+        return antes, ((max(ini, base), None) if ini <= ultimo else None), ((ini, None) if ini > ultimo else None)
+    dentro = (max(ini, base), min(fim, ultimo)) if ini <= ultimo and fim >= base else None
+    depois = (max(ini, ultimo + 1), fim) if fim > ultimo else None
+    return antes, dentro, depois
+
+
+def _somar_trechos(trechos: list, k: int) -> int:
+    """Soma dos trechos soltos (ini, fim ou None, valor por mês) nos meses anteriores a `k`."""
+    total = 0
+    for ini, fim, valor in trechos:
+        ate = k - 1 if fim is None else min(fim, k - 1)
+        if ate >= ini:
+            total += valor * (ate - ini + 1)
+    return total
+
+
+def _construir_relatorio(user_id: int) -> dict:
+    contribuicoes = []
+    q = (
+        db.session.query(Transacao.valor_total_centavos, Transacao.data, Transacao.parcelas,
+                         Transacao.valor_parcela_centavos, Transacao.recorrente, Transacao.categoria_id)
+        .filter(Transacao.user_id == user_id)
+        .execution_options(yield_per=5000)
+    )
+    for r in q:
+        contribuicoes.extend(_contribuicoes(r._asdict()))
+    # transações arquivadas entram pelo rollup mensal
+    for r in ResumoMensalArquivo.query.filter_by(user_id=user_id):
+        m = _num_mes(r.ano, r.mes)
+        if r.entradas_centavos:
+            contribuicoes.append((r.categoria_id, "entradas", m, m, r.entradas_centavos))
+        if r.saidas_centavos:
+            contribuicoes.append((r.categoria_id, "saidas", m, m, r.saidas_centavos))
+
+    indice = _relatorio_vazio(min((c[2] for c in contribuicoes), default=_mes_atual()))
+    base = indice["base"]
+    ultimo = max((c[3] if c[3] is not None else c[2] for c in contribuicoes), default=base)
+    indice["n"] = n = min(max(ultimo, base), indice["limites"][1]) - base + 1
+
+    # arrays de diferenças -> fluxo mensal -> somas de prefixo
+    deltas = {}
+    for categoria_id, lado, ini, fim, valor in contribuicoes:
+        antes, dentro, depois = _dividir_contribuicao(indice, ini, fim)
+        for chave in ("total", categoria_id):
+            serie = indice["series"].setdefault(chave, {}).setdefault(lado, _serie_vazia(n))
+            if antes:
+                serie["antes"].append((*antes, valor))
+            if depois:
+                serie["depois"].append((*depois, valor))
+            if dentro:
+                d = deltas.setdefault((chave, lado), [0] * (n + 1))
+                d[dentro[0] - base] += valor
+                if dentro[1] is not None:
+                    d[dentro[1] - base + 1] -= valor
+
+    for (chave, lado), d in deltas.items():
+        serie = indice["series"][chave][lado]
+        fluxo = 0
+        for i in range(n):
+            fluxo += d[i]
+            serie["p"][i + 1] = serie["p"][i] + fluxo
+        serie["taxa"] = fluxo + d[n]  # só as recorrentes continuam depois do array
+    return indice
+
+
+def _estender_relatorio(indice: dict, mes_ini: int, mes_fim: int):
+    """Garante que o array cubra [mes_ini, mes_fim], até os limites da janela."""
+    limite_ini, limite_fim = indice["limites"]
+    mes_ini = min(max(mes_ini, limite_ini), limite_fim)
+    mes_fim = min(max(mes_fim, limite_ini), limite_fim)
+    if mes_ini < indice["base"]:
+        k = indice["base"] - mes_ini
+        for lados in indice["series"].values():
+            for serie in lados.values():
+                serie["p"][:0] = [0] * k
+        indice["base"] = mes_ini
+        indice["n"] += k
+    if mes_fim >= indice["base"] + indice["n"]:
+        k = mes_fim - (indice["base"] + indice["n"]) + 1
+        for lados in indice["series"].values():
+            for serie in lados.values():
+                ultimo = serie["p"][-1]
+                serie["p"].extend(ultimo + serie["taxa"] * (i + 1) for i in range(k))
+        indice["n"] += k
+
+
+def _somar_trecho_solto(trechos: list, ini: int, fim: int | None, valor: int):
+    if (ini, fim, -valor) in trechos:  # desfaz o trecho que a escrita anterior deixou
+        trechos.remove((ini, fim, -valor))
+    else:
+        trechos.append((ini, fim, valor))
+
+
+def _aplicar_relatorio(indice: dict, antes: dict | None, depois: dict | None):
+    for snap, sinal in ((antes, -1), (depois, 1)):
+        if not snap:
+            continue
+        for categoria_id, lado, ini, fim, valor in _contribuicoes(snap):
+            _estender_relatorio(indice, ini, ini if fim is None else fim)
+            parte_antes, dentro, parte_depois = _dividir_contribuicao(indice, ini, fim)
+            for chave in ("total", categoria_id):
+                serie = indice["series"].setdefault(chave, {}).setdefault(lado, _serie_vazia(indice["n"]))
+                if parte_antes:
+                    _somar_trecho_solto(serie["antes"], *parte_antes, sinal * valor)
+                if parte_depois:
+                    _somar_trecho_solto(serie["depois"], *parte_depois, sinal * valor)
+                if not dentro:
+                    continue
+                d_ini, d_fim = dentro
+                duracao = None if d_fim is None else d_fim - d_ini + 1
+                p = serie["p"]
+                for i in range(d_ini - indice["base"] + 1, len(p)):
+                    meses = i - (d_ini - indice["base"])
+                    p[i] += sinal * valor * (meses if duracao is None else min(meses, duracao))
+                if d_fim is None:
+                    serie["taxa"] += sinal * valor
+
+
+registrar_indice("relatorio", _construir_relatorio, _aplicar_relatorio)
+
+
+def somar_periodo(indice: dict, chave, lado: str, mes_ini: int, mes_fim: int) -> int:
+    """
+    Soma de `lado` (centavos) nos meses [mes_ini, mes_fim] (numerados por _num_mes). O(1)
+    dentro da janela; fora dela, mais um termo por trecho solto.
+    """
+    serie = indice["series"].get(chave, {}).get(lado)
+    if serie is None:
+        return 0
+
+    def prefixo(k):
+        i = k - indice["base"]
+        if i <= 0:
+            return _somar_trechos(serie["antes"], k)
+        total_antes = _somar_trechos(serie["antes"], indice["base"]) if serie["antes"] else 0
+        if i <= indice["n"]:
+            return total_antes + serie["p"][i]
+        fora = _somar_trechos(serie["depois"], k) if serie["depois"] else 0
+        return total_antes + serie["p"][-1] + (i - indice["n"]) * serie["taxa"] + fora
+
+    return prefixo(mes_fim + 1) - prefixo(mes_ini)
+
+
+def resumo_periodo(indice: dict, mes_ini: int, mes_fim: int, categorias=()) -> dict:
+    entradas = somar_periodo(indice, "total", "entradas", mes_ini, mes_fim)
+    saidas = somar_periodo(indice, "total", "saidas", mes_ini, mes_fim)
+    resumo = {
+        "de": ym_label(mes_ini // 12, mes_ini % 12 + 1),
+        "ate": ym_label(mes_fim // 12, mes_fim % 12 + 1),
+        "entradas": entradas / 100,
+        "saidas": saidas / 100,
+        "saldo": (entradas - saidas) / 100,
+    }
+    if categorias:
+        resumo["categorias"] = [
+            {
+                "id": c.id,
+                "nome": c.nome,
+                "entradas": somar_periodo(indice, c.id, "entradas", mes_ini, mes_fim) / 100,
+                "saidas": somar_periodo(indice, c.id, "saidas", mes_ini, mes_fim) / 100,
+            }
+            for c in categorias
+        ]
+    return resumo
+
+
+def _ler_mes(valor: str, padrao: int) -> int:
+    """'2026-03' -> número do mês; padrão se vazio/ inválido."""
+    try:
+        ano, mes = (int(x) for x in valor.split("-"))
+        if not 1 <= mes <= 12:
+            raise ValueError
+    except ValueError:
+        return padrao
+    return _num_mes(ano, mes)
+
+
+@app.route("/relatorios")
+@leitura_replica
+@login_required
+def relatorios():
+    """
+    ?de=AAAA-MM&ate=AAAA-MM (inclusive; padrão: ano corrente)
+    &agrupar=mes|trimestre|ano  quebra o período em subtotais
+    &comparar=1                 inclui o mesmo período do ano anterior
+    """
+    hoje = datetime.today().date()
+    de = _ler_mes(request.args.get("de", ""), _num_mes(hoje.year, 1))
+    ate = _ler_mes(request.args.get("ate", ""), _num_mes(hoje.year, 12))
+    if ate < de:
+        de, ate = ate, de
+    ate = min(ate, de + RELATORIO_MAX_MESES - 1)
+
+    indice = indice_usuario("relatorio", current_user.id)
+    categorias = listar_categorias(current_user.id)
+    resposta = resumo_periodo(indice, de, ate, categorias)
+
+    passo = {"mes": 1, "trimestre": 3, "ano": 12}.get(request.args.get("agrupar", ""))
+    if passo:
+        # trimestres e anos alinhados ao calendário
+        inicio = de - de % passo
+        resposta["periodos"] = [
+            resumo_periodo(indice, max(m, de), min(m + passo - 1, ate))
+            for m in range(inicio, ate + 1, passo)
+        ]
+
+    if request.args.get("comparar") == "1":
+        anterior = resumo_periodo(indice, de - 12, ate - 12, categorias)
+        anterior["variacao_saidas"] = (
+            round((resposta["saidas"] - anterior["saidas"]) / anterior["saidas"] * 100, 1)
+            if anterior["saidas"] else None
+        )
+        resposta["ano_anterior"] = anterior
+
+    return jsonify(resposta)
+
+
+# ---------------- Orçamentos por categoria ----------------
+# Cada escrita reavalia só as categorias/meses que ela tocou, lendo os totais do
+# índice "relatorio" (O(1) por mês). O resultado fica em alertas_orcamento, que o
+# dashboard lê junto com os outros extras, sem recalcular gastos. Recorrentes só são
+# avaliadas numa janela em volta de hoje; a janela anda uma vez por mês (reavaliar_orcamentos_do_mes),
+# num job enfileirado no login e no `flask admin reavaliar-orcamentos` — nunca num GET, que pode
+# estar na réplica.
+ORCAMENTO_LIMIARES = (80, 100)  # % do orçamento
+ORCAMENTO_JANELA_MESES = 12     # recorrentes e reavaliações completas: hoje ± janela
+
+
+def _mes_atual() -> int:
+    hoje = date.today()
+    return _num_mes(hoje.year, hoje.month)
+
+
+def meses_tocados(antes: dict | None, depois: dict | None) -> dict:
+    """{categoria_id: {meses}} de saídas afetadas por uma escrita."""
+    alvos = {}
+    atual = _mes_atual()
+    for snap in (antes, depois):
+        if not snap or snap["categoria_id"] is None:
+            continue
+        for categoria_id, lado, ini, fim, _ in _contribuicoes(snap):
+            if lado != "saidas":
+                continue
+            if fim is None:
+                fim = max(ini, atual + ORCAMENTO_JANELA_MESES)
+                ini = max(ini, min(fim, atual - ORCAMENTO_JANELA_MESES))
+            alvos.setdefault(categoria_id, set()).update(range(ini, fim + 1))
+    return alvos
+
+
+def avaliar_orcamentos(user_id: int, alvos: dict):
+    """Atualiza os alertas das categorias/meses em `alvos` ({categoria_id: {meses}})."""
+    if not alvos:
+        return
+    ids = list(alvos)
+    limites = dict(
+        db.session.query(Categoria.id, Categoria.orcamento_centavos)
+        .filter(Categoria.user_id == user_id, Categoria.id.in_(ids), Categoria.orcamento_centavos != None)
+    )
+    existentes = {
+        (a.categoria_id, _num_mes(a.ano, a.mes)): a
+        for a in AlertaOrcamento.query.filter(
+            AlertaOrcamento.user_id == user_id, AlertaOrcamento.categoria_id.in_(ids)
+        )
+    }
+    if not limites and not existentes:
+        return
+
+    indice = indice_usuario("relatorio", user_id) if limites else None
+    for categoria_id, meses in alvos.items():
+        limite = limites.get(categoria_id)
+        for m in meses:
+            alerta = existentes.get((categoria_id, m))
+            gasto = somar_periodo(indice, categoria_id, "saidas", m, m) if limite else 0
+            nivel = max(
+                (p for p in ORCAMENTO_LIMIARES if limite and gasto * 100 >= limite * p),
+                default=None,
+            )
+            if nivel is None:
+                if alerta is not None:
+                    db.session.delete(alerta)
+                continue
+            if alerta is None:
+                alerta = AlertaOrcamento(user_id=user_id, categoria_id=categoria_id,
+                                         ano=m // 12, mes=m % 12 + 1)
+                db.session.add(alerta)
+            alerta.nivel = nivel
+            alerta.gasto_centavos = gasto
+    db.session.commit()
+
+
+def reavaliar_orcamentos(user_id: int, categoria_ids=None):
+    """Reavaliação completa (orçamento alterado, importação, CLI): janela em torno de hoje + alertas já gravados."""
+    q = db.session.query(Categoria.id).filter(Categoria.user_id == user_id)
+    if categoria_ids is not None:
+        q = q.filter(Categoria.id.in_(list(categoria_ids)))
+    atual = _mes_atual()
+    janela = range(atual - ORCAMENTO_JANELA_MESES, atual + ORCAMENTO_JANELA_MESES + 1)
+    alvos = {cid: set(janela) for (cid,) in q}
+    if not alvos:
+        return
+
+    for a in AlertaOrcamento.query.filter(
+        AlertaOrcamento.user_id == user_id, AlertaOrcamento.categoria_id.in_(list(alvos))
+    ):
+        alvos[a.categoria_id].add(_num_mes(a.ano, a.mes))
+    avaliar_orcamentos(user_id, alvos)
+
+
+def reavaliar_orcamentos_do_mes(user):
+    """
+    Uma vez por mês por usuário, reavalia a janela em volta de hoje: meses que entram
+    na janela das recorrentes não dependem de uma escrita para ganhar alerta. Roda no
+    job do login e no CLI; chamadas repetidas no mesmo mês não fazem nada.
+    """
+    atual = _mes_atual()
+    if user.orcamentos_mes == atual:
+        return
+    user.orcamentos_mes = atual
+    db.session.commit()
+    reavaliar_orcamentos(user.id)
+
+
+@app.route("/categorias/<int:cat_id>/orcamento", methods=["POST"])
+@login_required
+def definir_orcamento(cat_id):
+    mes = request.args.get("mes", "")
+    ano = request.args.get("ano", "")
+    busca = request.args.get("busca", "")
+    categoria_sel = request.args.get("categoria", "")
+
+    c = Categoria.query.filter_by(id=cat_id, user_id=current_user.id).first()
+    if not c:
+        flash("Categoria não encontrada.", "error")
+        return redirect(url_for("home", mes=mes, ano=ano, categoria=categoria_sel, busca=busca))
+
+    valor_str = (request.form.get("orcamento") or "").strip().replace(",", ".")
+    try:
+        valor = abs(float(valor_str)) if valor_str else None
+    except ValueError:
+        flash("Valor de orçamento inválido.", "error")
+        return redirect(url_for("home", mes=mes, ano=ano, categoria=categoria_sel, busca=busca))
+
+    c.orcamento = valor or None
+    db.session.commit()
+    reavaliar_orcamentos(current_user.id, [c.id])
+
+    flash("Orçamento atualizado ✅" if c.orcamento else "Orçamento removido ✅", "ok")
+    return redirect(url_for("home", mes=mes, ano=ano, categoria=categoria_sel, busca=busca))
+
+
+# ---------------- Jobs em segundo plano ----------------
+# Operações pesadas rodam num pool de threads local; o estado fica na tabela
+# `jobs`, então qualquer worker do gunicorn consegue responder /jobs/<id>.
+JOB_HANDLERS = {}
+_jobs_executor = None
+_jobs_lock = threading.Lock()
+
+
+def job_handler(tipo: str):
+    """Registra uma função handler(user_id, params, progresso) -> resultado (JSON)."""
+    def decorator(fn):
+        JOB_HANDLERS[tipo] = fn
+        return fn
+    return decorator
+
+
+def _executor():
+    global _jobs_executor
+    with _jobs_lock:
+        if _jobs_executor is None:
+            _jobs_executor = ThreadPoolExecutor(
+                max_workers=app.config["JOBS_WORKERS"], thread_name_prefix="ifinance-job"
+            )
+        return _jobs_executor
+
+
+def enfileirar_job(tipo: str, user_id: int, **params) -> str:
+    if tipo not in JOB_HANDLERS:
+        raise ValueError(f"Job desconhecido: {tipo}")
+
+    job_id = uuid.uuid4().hex
+    db.session.add(Job(id=job_id, user_id=user_id, tipo=tipo, parametros=json.dumps(params)))
+    db.session.commit()
+
+    _executor().submit(_executar_job, job_id)
+    return job_id
+
+
+def _atualizar_job(job_id: str, **campos):
+    campos["updated_at"] = datetime.utcnow()
+    db.session.query(Job).filter(Job.id == job_id).update(campos)
+    db.session.commit()
+
+
+def _job_disponivel():
+    """Pendente, ou executando com lease vencido (o worker que pegou morreu)."""
+    vencido = datetime.utcnow() - timedelta(seconds=app.config["JOBS_LEASE_SEGUNDOS"])
+    return (Job.status == "pendente") | ((Job.status == "executando") & (Job.updated_at < vencido))
+
+
+def _heartbeat_job(job_id: str, parar: threading.Event):
+    """Renova o lease (updated_at) enquanto o job roda, para ninguém tomá-lo."""
+    tabela = Job.__table__
+    with app.app_context():
+        while not parar.wait(app.config["JOBS_LEASE_SEGUNDOS"] / 3):
+            with db.engine.begin() as conn:
+                conn.execute(
+                    tabela.update()
+                    .where(tabela.c.id == job_id, tabela.c.status == "executando")
+                    .values(updated_at=datetime.utcnow())
+                )
+
+
+def _executar_job(job_id: str):
+    with app.app_context():
+        # "claim" atômico: só um worker/thread pega o job (pendente ou abandonado)
+        pegou = (
+            db.session.query(Job)
+            .filter(Job.id == job_id, _job_disponivel())
+            .update({"status": "executando", "updated_at": datetime.utcnow()}, synchronize_session=False)
+        )
+        db.session.commit()
+        if not pegou:
+            return
+
+        parar = threading.Event()
+        threading.Thread(target=_heartbeat_job, args=(job_id, parar), daemon=True).start()
+        try:
+            _rodar_job(job_id)
+        finally:
+            parar.set()
+
+
+def _rodar_job(job_id: str):
+    job = db.session.get(Job, job_id)
+    handler = JOB_HANDLERS.get(job.tipo)
+    params = json.loads(job.parametros or "{}")
+    user_id = job.user_id
+
+    def progresso(pct: int):
+        _atualizar_job(job_id, progresso=min(max(int(pct), 0), 100))
+
+    try:
+        if handler is None:
+            raise ValueError(f"Job desconhecido: {job.tipo}")
+        resultado = handler(user_id, params, progresso)
+    except Exception as e:
+        db.session.rollback()
+        tentativas = job.tentativas + 1
+        if tentativas < app.config["JOBS_MAX_TENTATIVAS"]:
+            _atualizar_job(job_id, status="pendente", tentativas=tentativas, erro=str(e))
+            # backoff simples antes de tentar de novo
+            threading.Timer(2 ** tentativas, lambda: _executor().submit(_executar_job, job_id)).start()
+        else:
+            _atualizar_job(job_id, status="erro", tentativas=tentativas, erro=str(e))
+        return
+
+    _atualizar_job(
+        job_id, status="concluido", progresso=100,
+        resultado=json.dumps(resultado), erro=None,
+    )
+
+
+def retomar_jobs_pendentes():
+    """
+    Fila durável: reenvia ao pool os jobs pendentes e os abandonados (lease vencido).
+    Jobs que outro worker vivo está rodando renovam o lease e ficam de fora; quem
+    pega de fato é o claim atômico de _executar_job.
+    """
+    ids = [job_id for (job_id,) in db.session.query(Job.id).filter(_job_disponivel())]
+    for job_id in ids:
+        _executor().submit(_executar_job, job_id)
+
+
+@app.route("/jobs/<job_id>")
+@login_required
+def status_job(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({"erro": "Job não encontrado."}), 404
+
+    return jsonify({
+        "id": job.id,
+        "tipo": job.tipo,
+        "status": job.status,
+        "progresso": job.progresso,
+        "tentativas": job.tentativas,
+        "resultado": json.loads(job.resultado) if job.resultado else None,
+        "erro": job.erro,
+    })
+
+
+# ---------------- Projeção ----------------
+def _ler_parametros_projecao(args) -> dict:
+    hoje = datetime.today().date()
+
+    try:
+        mes = int(args.get("mes", hoje.month))
+        ano = int(args.get("ano", hoje.year))
+        if not 1 <= mes <= 12:
+            raise ValueError
+    except ValueError:
+        mes, ano = hoje.month, hoje.year
+
+    try:
+        meses = int(args.get("meses", 12))
+    except ValueError:
+        meses = 12
+    meses = min(max(meses, 1), 600)
+
+    try:
+        saldo_inicial = float(args.get("saldo_inicial", 0) or 0)
+    except ValueError:
+        saldo_inicial = 0.0
+
+    return {"ano": ano, "mes": mes, "meses": meses, "saldo_inicial": saldo_inicial}
+
+
+@app.route("/projecao")
+@leitura_replica
+@login_required
+def projecao():
+    return jsonify(gerar_projecao(current_user.id, **_ler_parametros_projecao(request.args)))
+
+
+@app.route("/projecao/job", methods=["POST"])
+@login_required
+def projecao_job():
+    """Horizontes longos em segundo plano: devolve o id do job (acompanhe em /jobs/<id>)."""
+    job_id = enfileirar_job("projecao", current_user.id, **_ler_parametros_projecao(request.values))
+    return jsonify({"job_id": job_id, "status_url": url_for("status_job", job_id=job_id)}), 202
+
+
+def gerar_projecao(user_id: int, ano: int, mes: int, meses: int, saldo_inicial: float = 0.0) -> dict:
+    transacoes = obter_transacoes_projecao(user_id)
+    labels, entradas, despesas, saldo_mes, saldo_acumulado = calcular_projecao(
+        transacoes, ano, mes, meses, saldo_inicial
+    )
+    return {
+        "labels": labels,
+        "entradas": entradas,
+        "despesas": despesas,
+        "saldo_mes": saldo_mes,
+        "saldo_acumulado": saldo_acumulado,
+    }
+
+
+@job_handler("projecao")
+def job_projecao(user_id, params, progresso):
+    return gerar_projecao(
+        user_id, params["ano"], params["mes"], params["meses"], params.get("saldo_inicial", 0.0)
+    )
+
+
+@job_handler("arquivamento")
+def job_arquivamento(user_id, params, progresso):
+    return {"arquivadas": arquivar_transacoes(meses=params.get("meses"), user_id=user_id)}
+
+
+@job_handler("reavaliar_orcamentos")
+def job_reavaliar_orcamentos(user_id, params, progresso):
+    reavaliar_orcamentos_do_mes(db.session.get(User, user_id))
+    return {}
+
+
+@app.route("/arquivar", methods=["POST"])
+@login_required
+def arquivar_job():
+    """Arquiva as transações pagas antigas do usuário em segundo plano; a home acompanha o job."""
+    job_id = enfileirar_job("arquivamento", current_user.id)
+    return redirect(url_for("home", job=job_id))
+
+
+# ---------------- Importação de snapshots legados (dados_ifinance.json) ----------------
+_RE_ESPACOS_VIRGULAS = re.compile(r"[\s,]*")
+
+
+def iterar_json_legado(caminho: str, tamanho_bloco: int = 64 * 1024, ao_ler=None):
+    """
+    Lê o array "transacoes" de um snapshot {"next_id": ..., "transacoes": [...]}
+    objeto a objeto, em blocos, sem carregar o documento inteiro.
+    `ao_ler(bytes_lidos)` é chamado a cada bloco (para progresso).
+    """
+    decoder = json.JSONDecoder()
+    chave = '"transacoes"'
+    lidos = 0
+
+    with open(caminho, encoding="utf-8") as f:
+        def ler():
+            nonlocal lidos
+            bloco = f.read(tamanho_bloco)
+            lidos += len(bloco)
+            if ao_ler:
+                ao_ler(lidos)
+            return bloco
+
+        # 1) procura o início do array
+        buf = ""
+        while True:
+            i = buf.find(chave)
+            j = buf.find("[", i) if i >= 0 else -1
+            if j >= 0:
+                buf, pos = buf[j + 1:], 0
+                break
+            bloco = ler()
+            if not bloco:
+                return
+            buf = (buf[i:] if i >= 0 else buf[-len(chave):]) + bloco
+
+        # 2) decodifica um objeto por vez
+        while True:
+            pos = _RE_ESPACOS_VIRGULAS.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                bloco = ler()
+                if not bloco:
+                    if pos >= len(buf):
+                        return
+                    raise
+                buf, pos = buf[pos:] + bloco, 0
+                continue
+            yield obj
+
+
+def hash_importacao(descricao: str, valor_total_centavos: int, data_ref: date, parcelas: int) -> str:
+    # mais estrito que o fingerprint: "Uber" e "UBER!", ou 10x e 12x, são linhas diferentes do snapshot
+    chave = f"{descricao.strip()}|{valor_total_centavos / 100:.2f}|{data_ref.isoformat()}|{int(parcelas)}"
+    return hashlib.sha1(chave.encode("utf-8")).hexdigest()
+
+
+def legado_para_transacao(obj: dict, user_id: int) -> dict:
+    valor_total = float(obj["valor_total"])
+    parcelas = max(int(obj.get("parcelas") or 1), 1)
+    tipo = obj.get("tipo") if obj.get("tipo") in ("entrada", "saida") else (
+        "entrada" if valor_total > 0 else "saida"
+    )
+    valor_total = abs(valor_total) if tipo == "entrada" else -abs(valor_total)
+    # o valor_parcela do snapshot (ex.: -47.550000000000004) é descartado: a divisão
+    # em centavos é a mesma do app
+    return linha_bulk_transacao(
+        valor_total,
+        user_id=user_id,
+        descricao=(obj.get("descricao") or "").strip()[:255] or "(sem descrição)",
+        tipo=tipo,
+        data=datetime.strptime(obj["data"], "%Y-%m-%d").date(),
+        parcelas=parcelas,
+        pago=False,
+        recorrente=False,
+        created_at=datetime.utcnow(),
+    )
+
+
+CONFIANCA_AUTO_CATEGORIA = 0.5
+
+
+def importar_json_legado(caminho: str, user_id: int, lote: int = 1000, dry_run: bool = False,
+                         progresso=None) -> dict:
+    """
+    Importa um snapshot legado para o usuário. Linhas cujo hash_importacao
+    (descrição, valor, data, parcelas) já existe, em transacoes ou no arquivo, são
+    ignoradas, então rodar de novo o mesmo arquivo não duplica nada. A checagem é uma
+    consulta indexada por lote.
+    """
+    # rótulo automático pelo histórico do próprio usuário
+    categorizacao = indice_usuario("categorizacao", user_id)
+    categorias_validas = {c.id for c in listar_categorias(user_id)}
+
+    tamanho = os.path.getsize(caminho) or 1
+    ao_ler = (lambda n: progresso(n * 100 // tamanho)) if progresso else None
+
+    inseridas = ignoradas = invalidas = 0
+    pendentes = {}  # hash_importacao -> linha (também descarta repetidas dentro do arquivo)
+
+    def gravar():
+        nonlocal inseridas, ignoradas
+        if not pendentes:
+            return
+        # arquivadas também contam: pagas e arquivadas depois da 1ª importação não voltam
+        chaves = list(pendentes)
+        existentes = {
+            h for (h,) in db.session.execute(db.union(*(
+                db.select(M.hash_importacao).filter(M.user_id == user_id, M.hash_importacao.in_(chaves))
+                for M in (Transacao, TransacaoArquivo)
+            )))
+        }
+        novas = [m for h, m in pendentes.items() if h not in existentes]
+        ignoradas += len(pendentes) - len(novas)
+        inseridas += len(novas)
+        if novas and not dry_run:
+            db.session.bulk_insert_mappings(Transacao, novas)
+            db.session.commit()
+        pendentes.clear()
+
+    for obj in iterar_json_legado(caminho, ao_ler=ao_ler):
+        try:
+            m = legado_para_transacao(obj, user_id)
+        except (KeyError, TypeError, ValueError):
+            invalidas += 1
+            continue
+
+        if m["hash_importacao"] in pendentes:
+            ignoradas += 1
+            continue
+
+        categoria_id, confianca = sugerir_categoria(categorizacao, m["descricao"])
+        if categoria_id in categorias_validas and confianca >= CONFIANCA_AUTO_CATEGORIA:
+            m["categoria_id"] = categoria_id
+
+        pendentes[m["hash_importacao"]] = m
+        if len(pendentes) >= lote:
+            gravar()
+    gravar()
+
+    if inseridas and not dry_run:
+        preencher_agenda_parcelas()
+        reavaliar_orcamentos(user_id)
+
+    return {"inseridas": inseridas, "ignoradas": ignoradas, "invalidas": invalidas}
+
+
+@job_handler("importar_legado")
+def job_importar_legado(user_id, params, progresso):
+    resultado = importar_json_legado(params["caminho"], user_id, progresso=progresso)
+    # upload de /importar: some depois de importado (se falhar, fica para a próxima tentativa)
+    if params.get("temporario"):
+        os.remove(params["caminho"])
+    return resultado
+
+
+@app.route("/importar", methods=["POST"])
+@login_required
+def importar_upload():
+    """Recebe um snapshot legado (.json) e importa em segundo plano; a home acompanha o job."""
+    arquivo = request.files.get("arquivo")
+    if not arquivo or not arquivo.filename.lower().endswith(".json"):
+        flash("Envie o arquivo .json exportado pelo iFinance antigo.", "error")
+        return redirect(url_for("home"))
+
+    os.makedirs(app.config["IMPORTACAO_FOLDER"], exist_ok=True)
+    caminho = os.path.join(app.config["IMPORTACAO_FOLDER"], f"{uuid.uuid4().hex}.json")
+    arquivo.save(caminho)
+    job_id = enfileirar_job("importar_legado", current_user.id, caminho=caminho, temporario=True)
+    return redirect(url_for("home", job=job_id))
+
+
+# ---------------- CLI de manutenção (flask admin ...) ----------------
+admin_cli = AppGroup("admin", help="Comandos de manutenção dos dados.")
+app.cli.add_command(admin_cli)
+
+LOTE_CLI = 1000
+
+
+def _em_lotes(ids, tamanho: int = LOTE_CLI):
+    for i in range(0, len(ids), tamanho):
+        yield ids[i:i + tamanho]
+
+
+@admin_cli.command("stats")
+@click.option("--listar", is_flag=True, help="Lista as entradas sem tipo_entrada (streaming).")
+def stats_comando(listar):
+    """Resumo das transações por tipo_entrada (uma única consulta agrupada)."""
+    contagens = dict(
+        db.session.query(Transacao.tipo_entrada, db.func.count(Transacao.id))
+        .group_by(Transacao.tipo_entrada)
+        .all()
+    )
+    total = sum(contagens.values())
+
+    click.echo("=" * 70)
+    click.echo(f"📌 Total: {total}")
+    click.echo(f"💵 Salários automáticos: {contagens.get('salario', 0)}")
+    click.echo(f"✍️  Entradas manuais (modal): {contagens.get('entrada_manual', 0)}")
+    click.echo(f"📝 Transações normais (lista principal): {contagens.get(None, 0)}")
+    outros = {k: v for k, v in contagens.items() if k not in (None, "salario", "entrada_manual")}
+    for k, v in sorted(outros.items()):
+        click.echo(f"   {k}: {v}")
+    click.echo(f"🗄️  Arquivadas: {TransacaoArquivo.query.count()}")
+    click.echo("=" * 70)
+
+    if listar:
+        q = (
+            db.session.query(Transacao.id, Transacao.descricao, Transacao.valor_total_centavos, Transacao.data)
+            .filter(Transacao.tipo == "entrada", Transacao.tipo_entrada == None)
+            .order_by(Transacao.id)
+            .execution_options(yield_per=LOTE_CLI)
+        )
+        for tid, descricao, centavos, data in q:
+            click.echo(f"  - ID {tid}: {descricao}: R$ {centavos / 100:.2f} ({data.strftime('%d/%m/%Y')})")
+
+
+@admin_cli.command("backfill-agenda")
+@click.option("--dry-run", is_flag=True, help="Só conta, não grava.")
+def backfill_agenda_comando(dry_run):
+    """Gera parcelas_agenda para saídas parceladas sem agenda."""
+    if dry_run:
+        faltando = Transacao.query.filter(
+            Transacao.valor_total_centavos < 0,
+            Transacao.recorrente == False,
+            ~db.session.query(ParcelaAgenda.id)
+            .filter(ParcelaAgenda.transacao_id == Transacao.id)
+            .exists(),
+        ).count()
+        click.echo(f"[dry-run] {faltando} transações sem agenda.")
+        return
+
+    click.echo(f"{preencher_agenda_parcelas()} transações com agenda gerada.")
+
+
+@admin_cli.command("corrigir-tipo")
+@click.option("--dry-run", is_flag=True, help="Só conta, não grava.")
+def corrigir_tipo_comando(dry_run):
+    """Ajusta `tipo` para bater com o sinal de valor_total."""
+    errados_entrada = Transacao.query.filter(Transacao.valor_total_centavos > 0, Transacao.tipo != "entrada")
+    errados_saida = Transacao.query.filter(Transacao.valor_total_centavos < 0, Transacao.tipo != "saida")
+
+    if dry_run:
+        click.echo(f"[dry-run] {errados_entrada.count() + errados_saida.count()} transações com tipo incorreto.")
+        return
+
+    n = errados_entrada.update({"tipo": "entrada"}, synchronize_session=False)
+    n += errados_saida.update({"tipo": "saida"}, synchronize_session=False)
+    db.session.commit()
+    click.echo(f"{n} transações corrigidas.")
+
+
+@admin_cli.command("recategorizar")
+@click.option("--usuario", type=int, required=True)
+@click.option("--padrao", required=True, help="Trecho da descrição (ilike).")
+@click.option("--categoria", type=int, required=True, help="ID da categoria de destino.")
+@click.option("--somente-sem-categoria", is_flag=True, help="Não mexe em transações já categorizadas.")
+@click.option("--dry-run", is_flag=True, help="Só lista, não grava.")
+def recategorizar_comando(usuario, padrao, categoria, somente_sem_categoria, dry_run):
+    """Define a categoria das transações cuja descrição contém PADRAO."""
+    if not Categoria.query.filter_by(id=categoria, user_id=usuario).first():
+        raise click.ClickException("Categoria não encontrada para esse usuário.")
+
+    q = db.session.query(Transacao.id, Transacao.descricao).filter(
+        Transacao.user_id == usuario,
+        Transacao.descricao.ilike(f"%{padrao}%"),
+        (Transacao.categoria_id == None) | (Transacao.categoria_id != categoria),
+    )
+    if somente_sem_categoria:
+        q = q.filter(Transacao.categoria_id == None)
+
+    ids = []
+    for tid, descricao in q.order_by(Transacao.id).execution_options(yield_per=LOTE_CLI):
+        if dry_run:
+            click.echo(f"  - ID {tid}: {descricao}")
+        ids.append(tid)
+
+    if dry_run:
+        click.echo(f"[dry-run] {len(ids)} transações seriam recategorizadas.")
+        return
+
+    for lote in _em_lotes(ids):
+        Transacao.query.filter(Transacao.id.in_(lote)).update(
+            {"categoria_id": categoria}, synchronize_session=False
+        )
+        db.session.commit()
+    if ids:
+        reavaliar_orcamentos(usuario)
+    click.echo(f"{len(ids)} transações recategorizadas.")
+
+
+@admin_cli.command("verificar")
+def verificar_comando():
+    """Checagens de integridade; sai com código 1 se encontrar problemas."""
+    CategoriaT = db.aliased(Categoria)
+    checagens = {
+        "categoria inexistente": db.session.query(Transacao.id)
+            .outerjoin(CategoriaT, Transacao.categoria_id == CategoriaT.id)
+            .filter(Transacao.categoria_id != None, CategoriaT.id == None),
+        "categoria de outro usuário": db.session.query(Transacao.id)
+            .join(CategoriaT, Transacao.categoria_id == CategoriaT.id)
+            .filter(CategoriaT.user_id != Transacao.user_id),
+        "tipo diferente do sinal do valor": db.session.query(Transacao.id).filter(
+            ((Transacao.valor_total_centavos > 0) & (Transacao.tipo != "entrada"))
+            | ((Transacao.valor_total_centavos < 0) & (Transacao.tipo != "saida"))
+        ),
+        "parcelas <= 0": db.session.query(Transacao.id).filter(Transacao.parcelas <= 0),
+        "saída parcelada sem agenda": db.session.query(Transacao.id).filter(
+            Transacao.valor_total_centavos < 0,
+            Transacao.recorrente == False,
+            ~db.session.query(ParcelaAgenda.id)
+            .filter(ParcelaAgenda.transacao_id == Transacao.id)
+            .exists(),
+        ),
+        "agenda não fecha com o total": db.session.query(ParcelaAgenda.transacao_id)
+            .join(Transacao, ParcelaAgenda.transacao_id == Transacao.id)
+            .group_by(ParcelaAgenda.transacao_id, Transacao.valor_total_centavos)
+            .having(db.func.sum(ParcelaAgenda.valor_centavos) != Transacao.valor_total_centavos),
+        "agenda órfã": db.session.query(ParcelaAgenda.id)
+            .outerjoin(Transacao, ParcelaAgenda.transacao_id == Transacao.id)
+            .filter(Transacao.id == None),
+    }
+
+    problemas = 0
+    for nome, q in checagens.items():
+        n = q.count()
+        problemas += n
+        click.echo(f"{'✅' if n == 0 else '⚠️ '} {nome}: {n}")
+
+    if problemas:
+        raise SystemExit(1)
+
+
+@admin_cli.command("importar-legado")
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--usuario", type=int, required=True, help="ID do usuário que recebe as transações.")
+@click.option("--dry-run", is_flag=True, help="Só conta, não grava.")
+def importar_legado_comando(arquivo, usuario, dry_run):
+    """Importa um snapshot dados_ifinance.json (idempotente)."""
+    if not db.session.get(User, usuario):
+        raise click.ClickException("Usuário não encontrado.")
+
+    r = importar_json_legado(arquivo, usuario, dry_run=dry_run)
+    prefixo = "[dry-run] " if dry_run else ""
+    click.echo(f"{prefixo}{r['inseridas']} inseridas, {r['ignoradas']} já existiam, {r['invalidas']} inválidas.")
+
+
+def comandos_sql_do_get(cliente, url: str) -> tuple:
+    """
+    (resposta, comandos SQL) de um GET feito num app context novo: sessão e
+    usuário limpos, então o load_user também vai ao banco.
+    """
+    comandos = []
+
+    def contar(conn, cursor, statement, *args):
+        comandos.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values()) + [e.sync_engine for e in _async_engines.values()]
+        for e in engines:
+            event.listen(e, "before_cursor_execute", contar)
+        try:
+            resp = cliente.get(url)
+        finally:
+            for e in engines:
+                event.remove(e, "before_cursor_execute", contar)
+    return resp, comandos
+
+
+@admin_cli.command("contar-consultas")
+@click.option("--usuario", type=int, default=None, help="Usuário usado no GET (padrão: o primeiro).")
+@click.option("--max", "maximo", type=int, default=3, show_default=True,
+              help="Máximo de comandos SQL por GET / (inclui o load_user).")
+def contar_consultas_comando(usuario, maximo):
+    """Regressão: conta os comandos SQL de GET / e GET /?pagos=1; sai com 1 se passar de --max."""
+    u = db.session.get(User, usuario) if usuario else User.query.order_by(User.id).first()
+    if not u:
+        raise click.ClickException("Nenhum usuário para testar.")
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as sess:
+        sess["_user_id"] = str(u.id)
+        sess["_fresh"] = True
+
+    if app.config["ASYNC_DASHBOARD"]:
+        _engine_async(None)
+
+    estourou = False
+    for url in ("/", "/?pagos=1"):
+        resp, comandos = comandos_sql_do_get(cliente, url)
+        ok = resp.status_code == 200 and len(comandos) <= maximo
+        estourou |= not ok
+        click.echo(f"{'✅' if ok else '⚠️ '} GET {url}: {len(comandos)} comandos SQL (HTTP {resp.status_code})")
+
+    if estourou:
+        raise SystemExit(1)
+
+
+@admin_cli.command("reavaliar-orcamentos")
+@click.option("--usuario", type=int, default=None, help="Reavaliar só um usuário.")
+def reavaliar_orcamentos_comando(usuario):
+    """Anda a janela de orçamentos de quem ainda não foi reavaliado neste mês (rodar no cron)."""
+    atual = _mes_atual()
+    q = db.session.query(User.id).filter((User.orcamentos_mes == None) | (User.orcamentos_mes != atual))
+    if usuario:
+        q = q.filter(User.id == usuario)
+    ids = [uid for (uid,) in q.order_by(User.id)]
+    for uid in ids:
+        reavaliar_orcamentos_do_mes(db.session.get(User, uid))
+    click.echo(f"{len(ids)} usuários reavaliados.")
+
+
+@admin_cli.command("arquivar")
+@click.option("--meses", type=int, default=None, help="Idade mínima (meses) após a última parcela.")
+@click.option("--usuario", type=int, default=None, help="Arquivar só um usuário.")
+def arquivar_comando(meses, usuario):
+    """Move transações antigas já pagas para transacoes_arquivo."""
+    movidas = arquivar_transacoes(meses=meses, user_id=usuario)
+    click.echo(f"{movidas} transações arquivadas.")
+
+
 # ---------------- "Migração" simples para SQLite ----------------
+# colunas Float antigas (reais) -> coluna em centavos que as substitui, na ordem da migração
+# (a agenda é convertida a partir dos centavos da transação, então vem depois de transacoes)
+COLUNAS_EM_REAIS = {
+    "transacoes": {"valor_total": "valor_total_centavos", "valor_parcela": "valor_parcela_centavos"},
+    "transacoes_arquivo": {"valor_total": "valor_total_centavos", "valor_parcela": "valor_parcela_centavos"},
+    "parcelas_agenda": {"valor": "valor_centavos"},
+    "resumos_mensais_arquivo": {"entradas": "entradas_centavos", "saidas": "saidas_centavos"},
+    "alertas_orcamento": {"gasto": "gasto_centavos"},
+    "categorias": {"orcamento": "orcamento_centavos"},
+}
+
+
 def ensure_sqlite_schema():
     """
     SQLite não altera tabela automaticamente no create_all.
     Isso tenta adicionar colunas se o banco já existia.
-    """
-    uri = app.config["SQLALCHEMY_DATABASE_URI"]
-    if not uri.startswith("sqlite:"):
-        return
 
-    # cria tabelas novas
+    As colunas antigas vêm primeiro: os preenchimentos (centavos, fingerprint, hash_importacao) leem
+    pago/recorrente/categoria_id/tipo_entrada. Os preenchimentos só tocam linhas com
+    NULL, então um boot interrompido no meio é retomado no próximo.
+    """
+    # cria tabelas novas (também no Postgres: create_all só cria o que falta)
     db.create_all()
 
-    # verifica colunas de transacoes
-    cols_transacoes = db.session.execute(text("PRAGMA table_info(transacoes)")).fetchall()
-    col_names_transacoes = {c[1] for c in cols_transacoes}
-
-    if "categoria_id" not in col_names_transacoes:
-        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN categoria_id INTEGER"))
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite:"):
+        # verifica colunas de transacoes
+        cols_transacoes = db.session.execute(text("PRAGMA table_info(transacoes)")).fetchall()
+        col_names_transacoes = {c[1] for c in cols_transacoes}
+
+        if "categoria_id" not in col_names_transacoes:
+            db.session.execute(text("ALTER TABLE transacoes ADD COLUMN categoria_id INTEGER"))
+            db.session.commit()
+
+        if "observacoes" not in col_names_transacoes:
+            db.session.execute(text("ALTER TABLE transacoes ADD COLUMN observacoes TEXT"))
+            db.session.commit()
+
+        if "pago" not in col_names_transacoes:
+            db.session.execute(text("ALTER TABLE transacoes ADD COLUMN pago BOOLEAN DEFAULT 0"))
+            db.session.commit()
+
+        if "recorrente" not in col_names_transacoes:
+            db.session.execute(text("ALTER TABLE transacoes ADD COLUMN recorrente BOOLEAN DEFAULT 0"))
+            db.session.commit()
+
+        if "tipo_entrada" not in col_names_transacoes:
+            db.session.execute(text("ALTER TABLE transacoes ADD COLUMN tipo_entrada VARCHAR(20)"))
+            db.session.commit()
+
+        # verifica colunas de users
+        cols_users = db.session.execute(text("PRAGMA table_info(users)")).fetchall()
+        col_names_users = {c[1] for c in cols_users}
+
+        if "nome" not in col_names_users:
+            db.session.execute(text("ALTER TABLE users ADD COLUMN nome VARCHAR(100) DEFAULT 'Usuário'"))
+            db.session.commit()
+
+        if "foto_perfil" not in col_names_users:
+            db.session.execute(text("ALTER TABLE users ADD COLUMN foto_perfil VARCHAR(255)"))
+            db.session.commit()
+
+    # colunas novas que valem para SQLite e Postgres
+    cols = {c["name"] for c in db.inspect(db.engine).get_columns("transacoes")}
+    if "updated_at" not in cols:
+        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN updated_at TIMESTAMP"))
+        db.session.execute(text("UPDATE transacoes SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_transacoes_user_updated ON transacoes (user_id, updated_at)"
+        ))
         db.session.commit()
 
-    if "observacoes" not in col_names_transacoes:
-        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN observacoes TEXT"))
+    if "fingerprint" not in cols:
+        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN fingerprint VARCHAR(40)"))
+        for nome, colunas in (("ix_transacoes_user_fingerprint", "user_id, fingerprint"),
+                              ("ix_transacoes_user_data", "user_id, data")):
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON transacoes ({colunas})"))
         db.session.commit()
 
-    if "pago" not in col_names_transacoes:
-        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN pago BOOLEAN DEFAULT 0"))
+    cols_arquivo = {c["name"] for c in db.inspect(db.engine).get_columns("transacoes_arquivo")}
+    if "fingerprint" not in cols_arquivo:
+        db.session.execute(text("ALTER TABLE transacoes_arquivo ADD COLUMN fingerprint VARCHAR(40)"))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_transacoes_arquivo_user_fingerprint "
+            "ON transacoes_arquivo (user_id, fingerprint)"
+        ))
         db.session.commit()
 
-    if "recorrente" not in col_names_transacoes:
-        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN recorrente BOOLEAN DEFAULT 0"))
+    # chave da importação legada, separada do fingerprint (preenchida em preencher_fingerprints)
+    for tabela, existentes in (("transacoes", cols), ("transacoes_arquivo", cols_arquivo)):
+        if "hash_importacao" not in existentes:
+            db.session.execute(text(f"ALTER TABLE {tabela} ADD COLUMN hash_importacao VARCHAR(40)"))
+            db.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{tabela}_user_hash_importacao ON {tabela} (user_id, hash_importacao)"
+            ))
+            db.session.commit()
+    # paginação do arquivo na carga completa do /api/sync
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transacoes_arquivo_user_arquivado "
+        "ON transacoes_arquivo (user_id, arquivado_em, id)"
+    ))
+    db.session.commit()
+
+    cols_users = {c["name"] for c in db.inspect(db.engine).get_columns("users")}
+    if "orcamentos_mes" not in cols_users:
+        db.session.execute(text("ALTER TABLE users ADD COLUMN orcamentos_mes INTEGER"))
         db.session.commit()
 
-    if "tipo_entrada" not in col_names_transacoes:
-        db.session.execute(text("ALTER TABLE transacoes ADD COLUMN tipo_entrada VARCHAR(20)"))
+    # dinheiro em centavos inteiros: cria a coluna, converte e remove o Float antigo
+    for tabela, pares in COLUNAS_EM_REAIS.items():
+        existentes = {c["name"] for c in db.inspect(db.engine).get_columns(tabela)}
+        for centavos in pares.values():
+            if centavos not in existentes:
+                db.session.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {centavos} BIGINT"))
         db.session.commit()
 
-    # verifica colunas de users
-    cols_users = db.session.execute(text("PRAGMA table_info(users)")).fetchall()
-    col_names_users = {c[1] for c in cols_users}
+        antigas = [reais for reais in pares if reais in existentes]
+        if antigas:
+            preencher_centavos(tabela)
+            for reais in antigas:
+                db.session.execute(text(f"ALTER TABLE {tabela} DROP COLUMN {reais}"))
+            db.session.commit()
 
-    if "nome" not in col_names_users:
-        db.session.execute(text("ALTER TABLE users ADD COLUMN nome VARCHAR(100) DEFAULT 'Usuário'"))
+    preencher_fingerprints()
+
+
+def preencher_fingerprints(lote: int = 1000) -> int:
+    """
+    Calcula o fingerprint e o hash_importacao das transações (e arquivadas) que
+    ainda não têm, em lotes por id.
+    """
+    total = 0
+    for M in (Transacao, TransacaoArquivo):
+        tabela = M.__table__
+        ultimo_id = 0
+        while True:
+            linhas = (
+                db.session.query(M.id, M.descricao, M.valor_total_centavos, M.data, M.parcelas)
+                .filter(M.id > ultimo_id, (M.fingerprint == None) | (M.hash_importacao == None))
+                .order_by(M.id.asc())
+                .limit(lote)
+                .all()
+            )
+            if not linhas:
+                break
+            ultimo_id = linhas[-1].id
+            db.session.execute(
+                tabela.update().where(tabela.c.id == db.bindparam("b_id")).values(
+                    fingerprint=db.bindparam("b_fp"), hash_importacao=db.bindparam("b_hash"),
+                ),
+                [
+                    {
+                        "b_id": r.id,
+                        "b_fp": fingerprint_transacao(r.descricao, r.valor_total_centavos, r.data),
+                        "b_hash": hash_importacao(r.descricao, r.valor_total_centavos, r.data, r.parcelas),
+                    }
+                    for r in linhas
+                ],
+            )
+            db.session.commit()
+            total += len(linhas)
+    return total
+
+
+def preencher_centavos(tabela: str, lote: int = 1000) -> int:
+    """
+    Converte as colunas Float de `tabela` (COLUNAS_EM_REAIS) para centavos, em lotes por id.
+    Transações refazem a parcela e o fingerprint; a agenda usa a divisão de parcela_centavos
+    da transação. A tabela é refletida do banco, porque os Float não existem mais nos modelos.
+    """
+    t = db.Table(tabela, db.MetaData(), autoload_with=db.engine)
+    pares = COLUNAS_EM_REAIS[tabela]
+    reais, centavos = next(iter(pares.items()))
+    transacao = tabela in ("transacoes", "transacoes_arquivo")
+
+    consulta = db.select(t.c.id, *(t.c[r] for r in pares))
+    if transacao:
+        consulta = consulta.add_columns(t.c.descricao, t.c.data, t.c.parcelas, t.c.recorrente)
+    elif tabela == "parcelas_agenda":
+        tr = Transacao.__table__
+        consulta = consulta.add_columns(
+            t.c.numero, tr.c.valor_total_centavos.label("total_centavos"), tr.c.parcelas,
+        ).select_from(t.outerjoin(tr, t.c.transacao_id == tr.c.id))
+
+    def converter(r) -> dict:
+        if transacao:
+            total = para_centavos(r.valor_total)
+            return {"valor_total_centavos": total,
+                    **colunas_calculadas(r.descricao, total, r.data, r.parcelas or 1, bool(r.recorrente))}
+        if tabela == "parcelas_agenda" and r.total_centavos is not None:
+            return {"valor_centavos": parcela_centavos(r.total_centavos, max(r.parcelas, 1), r.numero - 1)}
+        return {c: para_centavos(r._mapping[col] or 0) for col, c in pares.items()}
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        linhas = db.session.execute(
+            consulta.filter(t.c.id > ultimo_id, t.c[centavos] == None, t.c[reais] != None)
+            .order_by(t.c.id.asc())
+            .limit(lote)
+        ).all()
+        if not linhas:
+            return total
+        ultimo_id = linhas[-1].id
+
+        params = [{"b_id": r.id, **{f"b_{k}": v for k, v in converter(r).items()}} for r in linhas]
+        campos = [k[2:] for k in params[0] if k != "b_id"]
+        db.session.execute(
+            t.update().where(t.c.id == db.bindparam("b_id")).values({c: db.bindparam(f"b_{c}") for c in campos}),
+            params,
+        )
         db.session.commit()
+        total += len(linhas)
+
+
+def preencher_agenda_parcelas(lote: int = 500) -> int:
+    """Gera parcelas_agenda para saídas parceladas que ainda não têm agenda."""
+    total = 0
+    ultimo_id = 0
+    while True:
+        sem_agenda = (
+            db.session.query(
+                Transacao.id, Transacao.user_id, Transacao.valor_total_centavos, Transacao.recorrente,
+                Transacao.data, Transacao.parcelas, Transacao.pago,
+            )
+            .filter(
+                Transacao.id > ultimo_id,
+                Transacao.valor_total_centavos < 0,
+                Transacao.recorrente == False,
+                ~db.session.query(ParcelaAgenda.id)
+                .filter(ParcelaAgenda.transacao_id == Transacao.id)
+                .exists(),
+            )
+            .order_by(Transacao.id.asc())
+            .limit(lote)
+            .all()
+        )
+        if not sem_agenda:
+            return total
+        ultimo_id = sem_agenda[-1].id
 
-    if "foto_perfil" not in col_names_users:
-        db.session.execute(text("ALTER TABLE users ADD COLUMN foto_perfil VARCHAR(255)"))
+        db.session.bulk_insert_mappings(ParcelaAgenda, [
+            dict(linha, transacao_id=t.id) for t in sem_agenda for linha in linhas_agenda(t)
+        ])
         db.session.commit()
+        total += len(sem_agenda)
 
 
 with app.app_context():
     ensure_sqlite_schema()
+    # agenda nova: preenche a partir das transações existentes uma única vez
+    if db.session.query(ParcelaAgenda.id).first() is None:
+        preencher_agenda_parcelas()
+    if app.config["JOBS_DURAVEIS"]:
+        retomar_jobs_pendentes()
 
 
 if __name__ == "__main__":
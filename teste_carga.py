@@ -0,0 +1,394 @@
+"""
+Teste de carga local: semeia N usuários com dados realistas, sobe o app no
+gunicorn e dispara um mix de tráfego concorrente (dashboard com filtros,
+paginação, busca, cadastro, edição, marcar pago, autocomplete e relatórios).
+No fim mostra throughput, latência p50/p95/p99 e taxa de erro por rota.
+
+Execute:
+    python teste_carga.py                                   # SQLite temporário
+    python teste_carga.py --usuarios 50 --concorrencia 32 --duracao 60
+    python teste_carga.py --database-url postgresql://localhost/ifinance_carga --workers 4
+
+Com --url o servidor não é iniciado (use um já rodando no mesmo banco).
+
+O padrão é --threads 1, que no gunicorn é o worker sync do Procfile
+(`gunicorn app:app`). Com --threads > 1 o gunicorn passa para gthread: não é
+o que roda em produção, e as requisições de um mesmo worker passam a dividir
+os índices em memória — os números não são comparáveis com os do worker sync.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from http.cookiejar import CookieJar
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+SENHA = "carga123"
+
+CATEGORIAS = ["Mercado", "Transporte", "Lazer", "Casa", "Saúde", "Assinaturas"]
+DESCRICOES = {
+    "Mercado": ["Mercado Extra", "Carrefour", "Padaria Pão Quente", "Hortifruti", "Atacadão"],
+    "Transporte": ["Uber", "99 Táxi", "Posto Shell", "Estacionamento", "Recarga Bilhete"],
+    "Lazer": ["iFood", "Cinema", "Bar do Zé", "Show", "Steam"],
+    "Casa": ["Conta de Luz", "Conta de Água", "Internet", "Magazine Luiza", "Leroy Merlin"],
+    "Saúde": ["Farmácia", "Consulta", "Academia", "Exame", "Drogasil"],
+    "Assinaturas": ["Netflix", "Spotify", "Amazon Prime", "iCloud", "Disney+"],
+}
+ENTRADAS = ["Freela", "Venda OLX", "Reembolso", "Bônus", "Pix recebido"]
+BUSCAS = ["uber", "mercado", "netflix", "farm", "conta", "pix", "ifood", "posto"]
+
+# rota -> peso no mix de tráfego
+MIX = {
+    "GET / (dashboard)": 30,
+    "GET / (paginação)": 10,
+    "GET / (busca)": 10,
+    "GET / (filtros)": 10,
+    "POST / (cadastrar)": 10,
+    "POST /editar": 8,
+    "POST /marcar_pago": 7,
+    "GET /api/sugestoes": 10,
+    "GET /relatorios": 5,
+}
+
+
+# ---------------- Sementes ----------------
+def gerar_transacoes(rnd: random.Random, user_id: int, categorias: dict, quantidade: int) -> list[dict]:
+    hoje = date.today()
+    agora = datetime.utcnow()
+    linhas = []
+    for _ in range(quantidade):
+        data_ref = hoje - timedelta(days=rnd.randint(0, 540))
+        sorteio = rnd.random()
+        if sorteio < 0.12:
+            descricao, categoria = rnd.choice(ENTRADAS), None
+            valor_total, parcelas, recorrente, tipo_entrada = round(rnd.uniform(100, 3000), 2), 1, False, "entrada_manual"
+        else:
+            categoria = rnd.choice(CATEGORIAS)
+            descricao = rnd.choice(DESCRICOES[categoria])
+            recorrente = categoria == "Assinaturas" and sorteio < 0.2
+            parcelas = 1 if recorrente or rnd.random() < 0.7 else rnd.randint(2, 12)
+            valor_total, tipo_entrada = -round(rnd.uniform(8, 900 if parcelas > 1 else 250), 2), None
+        linhas.append({
+            "user_id": user_id,
+            "categoria_id": categorias.get(categoria),
+            "descricao": descricao,
+            "valor_total": valor_total,
+            "tipo": "entrada" if valor_total > 0 else "saida",
+            "data": data_ref,
+            "parcelas": parcelas,
+            "pago": data_ref < hoje - timedelta(days=60) and rnd.random() < 0.8,
+            "recorrente": recorrente,
+            "tipo_entrada": tipo_entrada,
+            "created_at": agora,
+            "updated_at": agora,
+        })
+    return linhas
+
+
+def semear(usuarios: int, transacoes: int, semente: int) -> list[dict]:
+    """Cria os usuários (com categorias, salário e histórico) direto no banco de DATABASE_URL."""
+    import app as ifinance
+    from werkzeug.security import generate_password_hash
+
+    rnd = random.Random(semente)
+    prefixo = datetime.now().strftime("%Y%m%d%H%M%S")
+    senha_hash = generate_password_hash(SENHA)  # um hash só: scrypt é caro de propósito
+    contas = []
+
+    with ifinance.app.app_context():
+        db = ifinance.db
+        for i in range(usuarios):
+            u = ifinance.User(nome=f"Carga {i}", email=f"carga-{prefixo}-{i}@carga.local", password_hash=senha_hash)
+            db.session.add(u)
+            db.session.flush()
+
+            categorias = {}
+            for nome in CATEGORIAS:
+                c = ifinance.Categoria(user_id=u.id, nome=nome, orcamento=rnd.choice([None, 300.0, 800.0]))
+                db.session.add(c)
+                db.session.flush()
+                categorias[nome] = c.id
+
+            linhas = gerar_transacoes(rnd, u.id, categorias, transacoes)
+            salario = round(rnd.uniform(2500, 9000), 2)
+            linhas.append({
+                "user_id": u.id, "categoria_id": None, "descricao": "Salário", "valor_total": salario,
+                "tipo": "entrada", "data": date.today().replace(day=5), "parcelas": 999,
+                "pago": False, "recorrente": True, "tipo_entrada": "salario",
+                "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+            })
+            db.session.bulk_insert_mappings(ifinance.Transacao, [ifinance.linha_bulk_transacao(**m) for m in linhas])
+            db.session.commit()
+
+            ids = [
+                tid for (tid,) in db.session.query(ifinance.Transacao.id)
+                .filter(ifinance.Transacao.user_id == u.id, ifinance.Transacao.recorrente == False)
+            ]
+            contas.append({"email": u.email, "categorias": list(categorias.values()), "transacoes": ids})
+
+        ifinance.preencher_agenda_parcelas()
+    return contas
+
+
+# ---------------- Servidor ----------------
+def iniciar_gunicorn(porta: int, workers: int, threads: int, env: dict) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--bind", f"127.0.0.1:{porta}",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--log-level", "warning",
+    ]
+    return subprocess.Popen(cmd, cwd=DIRETORIO, env=env)
+
+
+def esperar_servidor(url: str, processo: subprocess.Popen | None, timeout: float = 30.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if processo is not None and processo.poll() is not None:
+            raise SystemExit("❌ O gunicorn saiu antes de ficar pronto.")
+        try:
+            urllib.request.urlopen(f"{url}/login", timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.3)
+    raise SystemExit(f"❌ Servidor não respondeu em {timeout:.0f}s: {url}")
+
+
+# ---------------- Cliente ----------------
+class SemRedirect(urllib.request.HTTPRedirectHandler):
+    """Mede só a requisição em si; o 302 do POST é a resposta esperada."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Usuario:
+    def __init__(self, base: str, conta: dict):
+        self.base = base
+        self.conta = conta
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), SemRedirect()
+        )
+
+    def requisitar(self, caminho: str, dados: dict | None = None) -> tuple[int, str]:
+        corpo = urllib.parse.urlencode(dados).encode() if dados is not None else None
+        try:
+            with self.opener.open(f"{self.base}{caminho}", data=corpo, timeout=30) as resp:
+                resp.read()
+                return resp.status, ""
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get("Location", "")
+
+    def login(self):
+        status, destino = self.requisitar("/login", {"email": self.conta["email"], "password": SENHA})
+        if status != 302 or "/login" in destino:
+            raise SystemExit(f"❌ Login falhou para {self.conta['email']} (HTTP {status}).")
+
+
+def montar_requisicao(rota: str, u: Usuario, rnd: random.Random) -> tuple[str, dict | None]:
+    hoje = date.today()
+    d = hoje - timedelta(days=rnd.randint(0, 365))
+    mes_ano = {"mes": d.month, "ano": d.year}
+
+    if rota == "GET / (dashboard)":
+        return "/?" + urllib.parse.urlencode({**mes_ano, "pagos": rnd.choice(["0", "0", "1"])}), None
+    if rota == "GET / (paginação)":
+        return "/?" + urllib.parse.urlencode({**mes_ano, "pagina": rnd.randint(2, 6)}), None
+    if rota == "GET / (busca)":
+        return "/?" + urllib.parse.urlencode({**mes_ano, "busca": rnd.choice(BUSCAS)}), None
+    if rota == "GET / (filtros)":
+        params = {
+            **mes_ano,
+            "categoria": rnd.choice(u.conta["categorias"]),
+            "filtro_tipo": rnd.choice(["", "entrada", "saida"]),
+            "ordenar": rnd.choice(["data", "valor_total", "descricao", "categoria", "parcelas"]),
+            "ordem": rnd.choice(["asc", "desc"]),
+            "cat_excluir": rnd.choice(u.conta["categorias"]),
+        }
+        return "/?" + urllib.parse.urlencode(params), None
+    if rota == "GET /api/sugestoes":
+        return "/api/sugestoes?" + urllib.parse.urlencode({"q": rnd.choice(BUSCAS)[: rnd.randint(1, 4)]}), None
+    if rota == "GET /relatorios":
+        ini = hoje.year - rnd.randint(0, 1)
+        return "/relatorios?" + urllib.parse.urlencode({
+            "de": f"{ini}-01", "ate": f"{hoje.year}-12",
+            "agrupar": rnd.choice(["mes", "trimestre", "ano"]), "comparar": "1",
+        }), None
+
+    categoria = rnd.choice(CATEGORIAS)
+    form = {
+        "descricao": rnd.choice(DESCRICOES[categoria]),
+        "valor": f"{rnd.uniform(8, 400):.2f}",
+        "tipo": "saida",
+        "data": d.isoformat(),
+        "parcelas": rnd.choice([1, 1, 1, 2, 3, 6, 10]),
+        "categoria_id": rnd.choice(u.conta["categorias"]),
+    }
+    if rota == "POST / (cadastrar)":
+        return "/", form
+    if rota == "POST /editar":
+        return f"/editar/{rnd.choice(u.conta['transacoes'])}", form
+    if rota == "POST /marcar_pago":
+        return f"/marcar_pago/{rnd.choice(u.conta['transacoes'])}", {}
+    raise ValueError(rota)
+
+
+def disparar(usuarios: list[Usuario], concorrencia: int, duracao: float, semente: int) -> tuple[dict, float]:
+    rotas, pesos = list(MIX), list(MIX.values())
+    resultados = {rota: {"latencias": [], "erros": 0} for rota in rotas}
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def trabalhador(n: int):
+        rnd = random.Random(semente * 1000 + n)
+        while time.monotonic() < fim:
+            u = rnd.choice(usuarios)
+            rota = rnd.choices(rotas, pesos)[0]
+            caminho, dados = montar_requisicao(rota, u, rnd)
+
+            t0 = time.perf_counter()
+            try:
+                status, destino = u.requisitar(caminho, dados)
+                erro = status >= 400 or "/login" in destino
+            except Exception:
+                erro = True
+            ms = (time.perf_counter() - t0) * 1000
+
+            with lock:
+                resultados[rota]["latencias"].append(ms)
+                resultados[rota]["erros"] += erro
+
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=trabalhador, args=(n,), daemon=True) for n in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados, time.monotonic() - inicio
+
+
+# ---------------- Relatório ----------------
+def percentil(ordenadas: list[float], p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, max(math.ceil(p / 100 * len(ordenadas)) - 1, 0))]
+
+
+def resumir(resultados: dict, segundos: float) -> dict:
+    rotas = {}
+    for rota, r in resultados.items():
+        lat = sorted(r["latencias"])
+        rotas[rota] = {
+            "requisicoes": len(lat),
+            "erros": r["erros"],
+            "taxa_erro": round(r["erros"] / len(lat) * 100, 2) if lat else 0.0,
+            "req_s": round(len(lat) / segundos, 1),
+            "p50_ms": round(percentil(lat, 50), 1),
+            "p95_ms": round(percentil(lat, 95), 1),
+            "p99_ms": round(percentil(lat, 99), 1),
+            "max_ms": round(lat[-1], 1) if lat else 0.0,
+        }
+    total = sum(r["requisicoes"] for r in rotas.values())
+    erros = sum(r["erros"] for r in rotas.values())
+    todas = sorted(ms for r in resultados.values() for ms in r["latencias"])
+    return {
+        "segundos": round(segundos, 1),
+        "requisicoes": total,
+        "req_s": round(total / segundos, 1),
+        "erros": erros,
+        "taxa_erro": round(erros / total * 100, 2) if total else 0.0,
+        "p50_ms": round(percentil(todas, 50), 1),
+        "p95_ms": round(percentil(todas, 95), 1),
+        "p99_ms": round(percentil(todas, 99), 1),
+        "rotas": rotas,
+    }
+
+
+def imprimir(resumo: dict, banco: str):
+    print("\n" + "=" * 96)
+    print(f"📊 Teste de carga — {banco}")
+    print("=" * 96)
+    print(f"{'Rota':<24}{'req':>8}{'req/s':>9}{'erros':>8}{'% erro':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    print("-" * 96)
+    for rota, r in sorted(resumo["rotas"].items(), key=lambda x: -x[1]["requisicoes"]):
+        print(f"{rota:<24}{r['requisicoes']:>8}{r['req_s']:>9}{r['erros']:>8}{r['taxa_erro']:>9}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+    print("-" * 96)
+    print(f"{'TOTAL':<24}{resumo['requisicoes']:>8}{resumo['req_s']:>9}{resumo['erros']:>8}{resumo['taxa_erro']:>9}"
+          f"{resumo['p50_ms']:>10}{resumo['p95_ms']:>10}{resumo['p99_ms']:>10}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga local do iFinance.")
+    parser.add_argument("--usuarios", type=int, default=20, help="Usuários semeados (padrão: 20).")
+    parser.add_argument("--transacoes", type=int, default=300, help="Transações por usuário (padrão: 300).")
+    parser.add_argument("--concorrencia", type=int, default=16, help="Clientes simultâneos (padrão: 16).")
+    parser.add_argument("--duracao", type=float, default=30, help="Segundos de carga (padrão: 30).")
+    parser.add_argument("--database-url", default=None,
+                        help="Banco usado pelo app (padrão: SQLite novo numa pasta temporária).")
+    parser.add_argument("--workers", type=int, default=2, help="Workers do gunicorn (padrão: 2).")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Threads por worker (padrão: 1, worker sync como no Procfile).")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--url", default=None, help="Usa um servidor já rodando em vez de subir o gunicorn.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--json", dest="saida_json", default=None, help="Grava o resumo neste arquivo.")
+    args = parser.parse_args()
+
+    banco = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="ifinance-carga-"), "carga.db")
+    env = {**os.environ, "DATABASE_URL": banco}
+    os.environ["DATABASE_URL"] = banco
+
+    print(f"🌱 Semeando {args.usuarios} usuários × {args.transacoes} transações em {banco} ...")
+    t0 = time.monotonic()
+    contas = semear(args.usuarios, args.transacoes, args.semente)
+    print(f"   pronto em {time.monotonic() - t0:.1f}s")
+
+    processo = None
+    base = (args.url or f"http://127.0.0.1:{args.porta}").rstrip("/")
+    if not args.url:
+        print(f"🚀 gunicorn: {args.workers} workers × {args.threads} threads em {base}")
+        processo = iniciar_gunicorn(args.porta, args.workers, args.threads, env)
+
+    try:
+        esperar_servidor(base, processo)
+        usuarios = [Usuario(base, c) for c in contas]
+        for u in usuarios:
+            u.login()
+
+        print(f"🔥 {args.concorrencia} clientes por {args.duracao:.0f}s ...")
+        resultados, segundos = disparar(usuarios, args.concorrencia, args.duracao, args.semente)
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait(timeout=15)
+
+    resumo = resumir(resultados, segundos)
+    resumo["config"] = {k: v for k, v in vars(args).items() if k != "saida_json"} | {"database_url": banco}
+    imprimir(resumo, banco.split("://")[0])
+
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as f:
+            json.dump(resumo, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resumo salvo em {args.saida_json}")
+
+    if resumo["erros"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
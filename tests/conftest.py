@@ -0,0 +1,79 @@
+import itertools
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+from flask.testing import FlaskClient
+
+# o app lê DATABASE_URL e cria o schema no import: aponta para um SQLite temporário antes
+_PASTA = tempfile.mkdtemp(prefix="ifinance-testes-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_PASTA, "testes.db")
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ.pop("ASYNC_DASHBOARD", None)
+os.environ.pop("JOBS_DURAVEIS", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as ifinance  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+def _ativar_foreign_keys(conn, registro):
+    # SQLite ignora FKs por padrão; ligadas, os testes pegam o que o Postgres recusaria
+    conn.execute("PRAGMA foreign_keys=ON")
+
+
+with ifinance.app.app_context():
+    event.listen(ifinance.db.engine, "connect", _ativar_foreign_keys)
+    ifinance.db.engine.dispose()
+
+_emails = itertools.count(1)
+
+
+class ClienteIsolado(FlaskClient):
+    """Cada requisição roda num app context próprio (sessão e `g` novos), como no servidor."""
+
+    def open(self, *args, **kwargs):
+        with ifinance.app.app_context():
+            return super().open(*args, **kwargs)
+
+
+ifinance.app.test_client_class = ClienteIsolado
+
+
+@pytest.fixture
+def ctx():
+    with ifinance.app.app_context():
+        yield ifinance.db.session
+
+
+@pytest.fixture
+def usuario(ctx):
+    """Usuário novo a cada teste (o banco é compartilhado pela sessão de testes)."""
+    u = ifinance.User(nome="Teste", email=f"teste-{next(_emails)}@ifinance.local", password_hash="x")
+    ctx.add(u)
+    ctx.commit()
+    return u
+
+
+@pytest.fixture
+def cliente(usuario):
+    c = ifinance.app.test_client()
+    with c.session_transaction() as sess:
+        sess["_user_id"] = str(usuario.id)
+        sess["_fresh"] = True
+    return c
+
+
+def nova_transacao(user_id: int, descricao: str, valor_total: float, data, parcelas: int = 1, **campos):
+    """Cria pelo ORM (eventos do mapper + agenda), como as rotas fazem."""
+    t = ifinance.Transacao(
+        user_id=user_id, descricao=descricao, valor_total=valor_total,
+        tipo="entrada" if valor_total > 0 else "saida", data=data, parcelas=parcelas,
+        created_at=datetime.utcnow(), **campos,
+    )
+    ifinance.gerar_agenda(t)
+    ifinance.db.session.add(t)
+    ifinance.db.session.commit()
+    return t
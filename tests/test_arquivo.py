@@ -0,0 +1,24 @@
+from datetime import date
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def test_excluir_categoria_com_transacoes_arquivadas(ctx, usuario, cliente):
+    mercado = ifinance.Categoria(user_id=usuario.id, nome="Mercado")
+    ctx.add(mercado)
+    ctx.commit()
+    mercado_id = mercado.id
+    antiga = date(date.today().year - 4, 3, 10)
+    arquivada_id = nova_transacao(usuario.id, "Carrefour", -120.0, antiga, categoria_id=mercado_id, pago=True).id
+    nova_transacao(usuario.id, "Padaria", -30.5, antiga, pago=True)  # mesmo mês, sem categoria
+    assert ifinance.arquivar_transacoes(user_id=usuario.id) == 2
+
+    resp = cliente.post(f"/categorias/{mercado_id}/excluir")
+
+    assert resp.status_code == 302
+    ctx.expire_all()
+    assert ctx.get(ifinance.Categoria, mercado_id) is None
+    assert ctx.get(ifinance.TransacaoArquivo, arquivada_id).categoria_id is None
+    resumos = ifinance.ResumoMensalArquivo.query.filter_by(user_id=usuario.id).all()
+    assert [(r.ano, r.mes, r.categoria_id, r.saidas) for r in resumos] == [(antiga.year, 3, None, 150.5)]
@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+
+import app as ifinance
+from conftest import nova_transacao
+
+MAX_COMANDOS_GET = 3  # load_user + lista + extras
+
+
+def semear_dashboard(ctx, user_id: int):
+    hoje = date.today()
+    mercado = ifinance.Categoria(user_id=user_id, nome="Mercado", orcamento=100.0)
+    lazer = ifinance.Categoria(user_id=user_id, nome="Lazer")
+    ctx.add_all([mercado, lazer])
+    ctx.commit()
+
+    nova_transacao(user_id, "Carrefour", -150.0, hoje, categoria_id=mercado.id)
+    nova_transacao(user_id, "Geladeira", -2400.0, hoje, parcelas=10, categoria_id=lazer.id)
+    nova_transacao(user_id, "Cinema", -40.0, hoje, categoria_id=lazer.id, pago=True)
+    nova_transacao(user_id, "Netflix", -39.9, hoje, parcelas=999, recorrente=True, categoria_id=lazer.id)
+    nova_transacao(user_id, "Salário", 5000.0, hoje, parcelas=999, recorrente=True, tipo_entrada="salario")
+    nova_transacao(user_id, "Freela", 800.0, hoje, tipo_entrada="entrada_manual")
+    ifinance.reavaliar_orcamentos(user_id)
+
+
+def test_dashboard_no_maximo_3_comandos_sql(ctx, usuario, cliente):
+    semear_dashboard(ctx, usuario.id)
+    assert cliente.get("/").status_code == 200  # aquece caches de processo
+
+    for url in ("/", "/?pagos=1"):
+        resp, comandos = ifinance.comandos_sql_do_get(cliente, url)
+        assert resp.status_code == 200
+        assert len(comandos) <= MAX_COMANDOS_GET, f"GET {url}: {len(comandos)} comandos\n" + "\n".join(comandos)
+
+
+def test_dashboard_mostra_alerta_de_orcamento(ctx, usuario, cliente):
+    semear_dashboard(ctx, usuario.id)
+
+    html = cliente.get("/").get_data(as_text=True)
+
+    assert "Mercado" in html
+    assert "R$ 150.00 de R$ 100.00" in html
+
+
+def test_dashboard_async_devolve_o_mesmo_que_o_sincrono(ctx, usuario, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    semear_dashboard(ctx, usuario.id)
+    hoje = date.today()
+    args = (usuario.id, "", False, None, [], [], "data", "desc", hoje.year, hoje.month)
+
+    sincrono = ifinance.carregar_dashboard(*args)
+    monkeypatch.setitem(ifinance.app.config, "ASYNC_DASHBOARD", True)
+    assincrono = ifinance.carregar_dashboard(*args)
+
+    assert ifinance.app.config["ASYNC_DASHBOARD"]  # achou o driver: não voltou para o caminho síncrono
+    assert ifinance._async_engines[None].url.drivername == "sqlite+aiosqlite"
+    assert assincrono == sincrono
+    assert [t["descricao"] for t in assincrono["transacoes"]]
+    assert assincrono["parcelas_mes"]
@@ -0,0 +1,43 @@
+from datetime import date
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def test_parcelas_fecham_com_o_total():
+    total = ifinance.para_centavos(-263.31)
+    parcelas = [ifinance.parcela_centavos(total, 6, i) for i in range(6)]
+
+    assert parcelas == [-4389, -4389, -4389, -4388, -4388, -4388]
+    assert sum(parcelas) == total
+
+
+def test_para_centavos_arredonda_meio_centavo_para_longe_do_zero():
+    assert ifinance.para_centavos(1.005) == 101
+    assert ifinance.para_centavos(-43.885) == -4389
+    assert ifinance.para_centavos(0.1 + 0.2) == 30
+
+
+def test_recorrente_cobra_o_total_por_mes():
+    v = ifinance.linha_bulk_transacao(-39.9, descricao="Streaming", data=date(2025, 1, 5), parcelas=999,
+                                      recorrente=True)
+
+    assert v["valor_total_centavos"] == v["valor_parcela_centavos"] == -3990
+    assert v["fingerprint"] == ifinance.fingerprint_transacao("Streaming", -3990, date(2025, 1, 5))
+
+
+def test_valores_em_reais_vem_dos_centavos(ctx, usuario):
+    t = nova_transacao(usuario.id, "Curso", -100.0, date(2025, 1, 10), parcelas=3)
+
+    assert (t.valor_total_centavos, t.valor_parcela_centavos) == (-10000, -3334)
+    assert (t.valor_total, t.valor_parcela) == (-100.0, -33.34)
+    assert "valor_total" not in ifinance.Transacao.__table__.c
+
+
+def test_agenda_gravada_soma_o_total(ctx, usuario):
+    t = nova_transacao(usuario.id, "Notebook", -1000.0, date(2025, 1, 31), parcelas=3)
+
+    valores = [p.valor_centavos for p in t.agenda]
+    assert valores == [-33334, -33333, -33333]
+    assert sum(valores) == t.valor_total_centavos
+    assert [p.vencimento for p in t.agenda] == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)]
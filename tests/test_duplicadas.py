@@ -0,0 +1,36 @@
+from datetime import date
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def test_duplicada_exata_usa_o_valor_arredondado_como_gravado(ctx, usuario):
+    t = nova_transacao(usuario.id, "Café", 1.005, date(2025, 5, 2))
+    assert t.valor_total == 1.01
+
+    assert t.valor_total_centavos == 101
+
+    assert ifinance.duplicada_exata(usuario.id, "café", 101, date(2025, 5, 2)).id == t.id
+    assert ifinance.duplicada_exata(usuario.id, "Café", ifinance.para_centavos(1.005), date(2025, 5, 2)).id == t.id
+    assert ifinance.duplicada_exata(usuario.id, "Café", 100, date(2025, 5, 2)) is None
+
+
+def test_cadastro_repetido_pede_confirmacao(ctx, usuario, cliente):
+    form = {"descricao": "Uber", "valor": "23.455", "tipo": "saida", "data": "2025-05-02", "parcelas": "1"}
+
+    cliente.post("/", data=form)
+    cliente.post("/", data=form)
+    assert ifinance.Transacao.query.filter_by(user_id=usuario.id).count() == 1
+
+    cliente.post("/", data={**form, "forcar_duplicada": "1"})
+    assert ifinance.Transacao.query.filter_by(user_id=usuario.id).count() == 2
+
+
+def test_parecidas_na_janela_de_datas_e_valor(ctx, usuario):
+    nova_transacao(usuario.id, "Mercado Extra Centro", -100.0, date(2025, 5, 2))
+    nova_transacao(usuario.id, "Mercado Extra", -300.0, date(2025, 5, 2))  # valor longe
+    nova_transacao(usuario.id, "Farmácia", -101.0, date(2025, 5, 3))       # descrição diferente
+
+    parecidas = ifinance.possiveis_duplicadas(usuario.id, "mercado extra", -10300, date(2025, 5, 4))
+
+    assert [t.descricao for t in parecidas] == ["Mercado Extra Centro"]
@@ -0,0 +1,83 @@
+import json
+
+import app as ifinance
+
+OBJETOS = [
+    {"id": 1, "descricao": "Colchete ] e chave } no texto", "valor_total": -10.5, "data": "2024-01-02"},
+    {"id": 2, "descricao": "Aspas \"escapadas\", vírgulas, , e \\barra", "valor_total": 99.99, "data": "2024-02-03"},
+    {"id": 3, "descricao": "Acentuação: pão, maçã, café ☕", "valor_total": -263.31, "data": "2024-03-04",
+     "parcelas": 6, "extra": {"aninhado": [1, 2, {"x": "]"}]}},
+]
+
+
+def gravar_snapshot(pasta, objetos, **dump):
+    caminho = pasta / "dados_ifinance.json"
+    caminho.write_text(json.dumps({"next_id": len(objetos) + 1, "transacoes": objetos}, ensure_ascii=False, **dump),
+                       encoding="utf-8")
+    return str(caminho)
+
+
+def test_streaming_devolve_os_mesmos_objetos_com_blocos_pequenos(tmp_path):
+    caminho = gravar_snapshot(tmp_path, OBJETOS, indent=2)
+
+    for tamanho in (1, 7, 64, 64 * 1024):
+        assert list(ifinance.iterar_json_legado(caminho, tamanho_bloco=tamanho)) == OBJETOS
+
+
+def test_streaming_aceita_array_vazio_e_arquivo_sem_transacoes(tmp_path):
+    assert list(ifinance.iterar_json_legado(gravar_snapshot(tmp_path, []), tamanho_bloco=3)) == []
+
+    sem_chave = tmp_path / "outro.json"
+    sem_chave.write_text('{"next_id": 1}', encoding="utf-8")
+    assert list(ifinance.iterar_json_legado(str(sem_chave), tamanho_bloco=3)) == []
+
+
+def test_streaming_informa_bytes_lidos(tmp_path):
+    caminho = gravar_snapshot(tmp_path, OBJETOS)
+    lidos = []
+
+    list(ifinance.iterar_json_legado(caminho, tamanho_bloco=50, ao_ler=lidos.append))
+
+    assert lidos == sorted(lidos)
+    assert lidos[-1] == len(open(caminho, encoding="utf-8").read())
+
+
+def test_importar_de_novo_nao_duplica(ctx, usuario, tmp_path):
+    caminho = gravar_snapshot(tmp_path, OBJETOS + [OBJETOS[0]])
+
+    primeira = ifinance.importar_json_legado(caminho, usuario.id, lote=2)
+    segunda = ifinance.importar_json_legado(caminho, usuario.id, lote=2)
+
+    assert primeira == {"inseridas": 3, "ignoradas": 1, "invalidas": 0}
+    assert segunda == {"inseridas": 0, "ignoradas": 4, "invalidas": 0}
+    assert ifinance.Transacao.query.filter_by(user_id=usuario.id).count() == 3
+
+
+def test_reimportar_depois_de_arquivar_nao_duplica(ctx, usuario, tmp_path):
+    caminho = gravar_snapshot(tmp_path, OBJETOS)
+    assert ifinance.importar_json_legado(caminho, usuario.id)["inseridas"] == 3
+
+    # tudo pago e arquivado (as datas do snapshot são de 2024)
+    for t in ifinance.Transacao.query.filter_by(user_id=usuario.id):
+        t.pago = True
+    ctx.commit()
+    assert ifinance.arquivar_transacoes(meses=0, user_id=usuario.id) == 3
+
+    assert ifinance.importar_json_legado(caminho, usuario.id) == {"inseridas": 0, "ignoradas": 3, "invalidas": 0}
+    assert ifinance.Transacao.query.filter_by(user_id=usuario.id).count() == 0
+
+
+def test_linhas_que_so_o_fingerprint_confunde_sao_importadas(ctx, usuario, tmp_path):
+    # mesmo fingerprint (descrição normalizada, valor, data), mas linhas distintas do snapshot
+    objetos = [
+        {"id": 1, "descricao": "Uber", "valor_total": -25.0, "data": "2024-05-10"},
+        {"id": 2, "descricao": "UBER!", "valor_total": -25.0, "data": "2024-05-10"},
+        {"id": 3, "descricao": "Geladeira", "valor_total": -3000.0, "data": "2024-05-11", "parcelas": 10},
+        {"id": 4, "descricao": "Geladeira", "valor_total": -3000.0, "data": "2024-05-11", "parcelas": 12},
+    ]
+    caminho = gravar_snapshot(tmp_path, objetos)
+
+    assert ifinance.importar_json_legado(caminho, usuario.id) == {"inseridas": 4, "ignoradas": 0, "invalidas": 0}
+    assert ifinance.importar_json_legado(caminho, usuario.id) == {"inseridas": 0, "ignoradas": 4, "invalidas": 0}
+    geladeiras = ifinance.Transacao.query.filter_by(user_id=usuario.id, descricao="Geladeira")
+    assert sorted(t.parcelas for t in geladeiras) == [10, 12]
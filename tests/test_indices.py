@@ -0,0 +1,123 @@
+import random
+from datetime import date, timedelta
+
+import app as ifinance
+
+INDICES = ("categorizacao", "sugestoes", "relatorio")
+DESCRICOES = ["Uber", "Uber Eats", "Mercado Extra", "Mercado", "Netflix", "Farmácia", "Posto Shell"]
+
+
+def formulario(rnd: random.Random, categorias) -> dict:
+    form = {
+        "descricao": rnd.choice(DESCRICOES),
+        "valor": f"{rnd.uniform(5, 500):.2f}",
+        "tipo": rnd.choice(["saida", "saida", "saida", "entrada"]),
+        "data": (date(2025, 6, 15) + timedelta(days=rnd.randint(-400, 400))).isoformat(),
+        "parcelas": str(rnd.choice([1, 1, 2, 6, 12])),
+        "categoria_id": str(rnd.choice(categorias)),
+        "forcar_duplicada": "1",
+    }
+    if rnd.random() < 0.1:
+        form["recorrente"] = "on"
+    return form
+
+
+def conferir_com_reconstrucao(user_id: int):
+    cat = ifinance._cache_usuarios[("categorizacao", user_id)][1]
+    assert cat == ifinance._construir_categorizacao(user_id)
+
+    sug = ifinance._cache_usuarios[("sugestoes", user_id)][1]
+    novo = ifinance._construir_sugestoes(user_id)
+    assert sug["chaves"] == novo["chaves"]
+    # frequência e dados da última vez usada (valor, parcelas, categoria...)
+    assert sug["entradas"] == novo["entradas"]
+
+    rel = ifinance._cache_usuarios[("relatorio", user_id)][1]
+    novo = ifinance._construir_relatorio(user_id)
+    for chave in novo["series"]:
+        for lado in ("entradas", "saidas"):
+            for m in range(ifinance._num_mes(2023, 1), ifinance._num_mes(2028, 1)):
+                assert ifinance.somar_periodo(rel, chave, lado, m, m) == ifinance.somar_periodo(novo, chave, lado, m, m)
+
+
+def contar_reconstrucoes(monkeypatch) -> dict:
+    reconstrucoes = {nome: 0 for nome in INDICES}
+    for nome in INDICES:
+        construir, aplicar = ifinance.INDICES_USUARIO[nome]
+
+        def contando(user_id, _nome=nome, _construir=construir):
+            reconstrucoes[_nome] += 1
+            return _construir(user_id)
+
+        monkeypatch.setitem(ifinance.INDICES_USUARIO, nome, (contando, aplicar))
+    return reconstrucoes
+
+
+def test_escritas_atualizam_os_indices_sem_descartar_o_cache(ctx, usuario, cliente, monkeypatch):
+    cats = [ifinance.Categoria(user_id=usuario.id, nome=n) for n in ("Transporte", "Casa")]
+    ctx.add_all(cats)
+    ctx.commit()
+    categorias = [""] + [c.id for c in cats]
+    uid = usuario.id
+
+    rnd = random.Random(3)
+    for _ in range(3):
+        cliente.post("/", data=formulario(rnd, categorias))
+    for nome in INDICES:
+        ifinance.indice_usuario(nome, uid)
+    reconstrucoes = contar_reconstrucoes(monkeypatch)
+
+    for _ in range(30):
+        ids = [tid for (tid,) in ctx.query(ifinance.Transacao.id).filter_by(user_id=uid)]
+        op = rnd.choice(["criar", "editar", "editar", "remover"])
+        if op == "criar" or not ids:
+            cliente.post("/", data=formulario(rnd, categorias))
+        elif op == "editar":
+            cliente.post(f"/editar/{rnd.choice(ids)}", data=formulario(rnd, categorias))
+        else:
+            cliente.post(f"/remover/{rnd.choice(ids)}")
+        ctx.expire_all()
+
+        # o cache foi atualizado pela escrita, não reconstruído
+        for nome in INDICES:
+            ifinance.indice_usuario(nome, uid)
+        assert reconstrucoes == dict.fromkeys(INDICES, 0), op
+        conferir_com_reconstrucao(uid)
+
+
+def test_escrita_nao_altera_o_indice_que_um_leitor_ja_recebeu(ctx, usuario, cliente):
+    cliente.post("/", data={"descricao": "Uber", "valor": "20", "tipo": "saida", "data": "2025-06-01"})
+    uid = usuario.id
+    lidos = {nome: ifinance.indice_usuario(nome, uid) for nome in INDICES}
+    antes = {nome: repr(indice) for nome, indice in lidos.items()}
+
+    cliente.post("/", data={"descricao": "Mercado", "valor": "90", "tipo": "saida", "data": "2025-06-02",
+                            "forcar_duplicada": "1"})
+
+    for nome in INDICES:
+        assert repr(lidos[nome]) == antes[nome], nome
+        assert ifinance.indice_usuario(nome, uid) is not lidos[nome]
+    assert "mercado" in ifinance.indice_usuario("sugestoes", uid)["entradas"]
+
+
+def test_remover_a_ultima_usada_volta_aos_dados_da_anterior(ctx, usuario, cliente):
+    cat = ifinance.Categoria(user_id=usuario.id, nome="Transporte")
+    ctx.add(cat)
+    ctx.commit()
+    uid = usuario.id
+    base = {"tipo": "saida", "forcar_duplicada": "1"}
+    cliente.post("/", data={**base, "descricao": "Uber", "valor": "30", "data": "2025-06-01",
+                            "parcelas": "2", "categoria_id": str(cat.id)})
+    cliente.post("/", data={**base, "descricao": "UBER!", "valor": "45", "data": "2025-06-03"})
+    cliente.post("/", data={**base, "descricao": "Uber", "valor": "12", "data": "2025-06-05"})
+    for nome in INDICES:
+        ifinance.indice_usuario(nome, uid)
+    assert ifinance.indice_usuario("sugestoes", uid)["entradas"]["uber"]["valor_total_centavos"] == -1200
+
+    ids = [tid for (tid,) in ctx.query(ifinance.Transacao.id).filter_by(user_id=uid).order_by(ifinance.Transacao.id)]
+    cliente.post(f"/remover/{ids[2]}")
+    cliente.post(f"/editar/{ids[1]}", data={**base, "descricao": "Táxi", "valor": "45", "data": "2025-06-03"})
+
+    e = ifinance.indice_usuario("sugestoes", uid)["entradas"]["uber"]
+    assert (e["frequencia"], e["valor_total_centavos"], e["parcelas"], e["categoria_id"]) == (1, -3000, 2, cat.id)
+    conferir_com_reconstrucao(uid)
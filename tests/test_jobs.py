@@ -0,0 +1,127 @@
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as ifinance
+
+chamadas = []
+
+
+@ifinance.job_handler("teste_eco")
+def job_eco(user_id, params, progresso):
+    chamadas.append(params["n"])
+    return {"n": params["n"]}
+
+
+@pytest.fixture(autouse=True)
+def limpar_chamadas():
+    chamadas.clear()
+
+
+def criar_job(ctx, user_id: int, status: str, idade: timedelta, n: int = 1) -> str:
+    job_id = uuid.uuid4().hex
+    quando = datetime.utcnow() - idade
+    ctx.add(ifinance.Job(id=job_id, user_id=user_id, tipo="teste_eco", parametros=json.dumps({"n": n}),
+                         status=status, created_at=quando, updated_at=quando))
+    ctx.commit()
+    return job_id
+
+
+def test_nao_toma_job_que_outro_worker_esta_rodando(ctx, usuario):
+    job_id = criar_job(ctx, usuario.id, "executando", timedelta(seconds=5))
+
+    ifinance._executar_job(job_id)
+
+    ctx.expire_all()
+    assert chamadas == []
+    assert ctx.get(ifinance.Job, job_id).status == "executando"
+
+
+def test_retoma_job_com_lease_vencido(ctx, usuario):
+    job_id = criar_job(ctx, usuario.id, "executando", timedelta(hours=1), n=7)
+
+    ifinance._executar_job(job_id)
+    ifinance._executar_job(job_id)  # já concluído: não roda de novo
+
+    ctx.expire_all()
+    job = ctx.get(ifinance.Job, job_id)
+    assert chamadas == [7]
+    assert job.status == "concluido"
+    assert json.loads(job.resultado) == {"n": 7}
+
+
+def test_retomar_so_reenvia_pendentes_e_abandonados(ctx, usuario, monkeypatch):
+    pendente = criar_job(ctx, usuario.id, "pendente", timedelta(seconds=1))
+    abandonado = criar_job(ctx, usuario.id, "executando", timedelta(hours=1))
+    vivo = criar_job(ctx, usuario.id, "executando", timedelta(seconds=1))
+    criar_job(ctx, usuario.id, "concluido", timedelta(hours=1))
+    enviados = []
+
+    class PoolFalso:
+        def submit(self, fn, job_id):
+            enviados.append(job_id)
+
+    monkeypatch.setattr(ifinance, "_executor", lambda: PoolFalso())
+    ifinance.retomar_jobs_pendentes()
+
+    assert pendente in enviados and abandonado in enviados
+    assert vivo not in enviados
+    ctx.expire_all()
+    assert ctx.get(ifinance.Job, vivo).status == "executando"
+
+
+def test_projecao_assincrona_so_por_post(ctx, usuario, cliente, monkeypatch):
+    monkeypatch.setattr(ifinance, "_executor", lambda: type("Pool", (), {"submit": lambda *a: None})())
+
+    resp = cliente.get("/projecao?async=1&meses=3")
+    assert resp.status_code == 200 and len(resp.get_json()["labels"]) == 3
+    assert ifinance.Job.query.filter_by(user_id=usuario.id).count() == 0
+
+    resp = cliente.post("/projecao/job", data={"meses": "24"})
+    assert resp.status_code == 202
+    job = ctx.get(ifinance.Job, resp.get_json()["job_id"])
+    assert job.tipo == "projecao" and json.loads(job.parametros)["meses"] == 24
+
+
+def test_importacao_por_upload_roda_como_job(ctx, usuario, cliente, monkeypatch, tmp_path):
+    enviados = []
+
+    class PoolFalso:
+        def submit(self, fn, job_id):
+            enviados.append(job_id)
+
+    monkeypatch.setattr(ifinance, "_executor", lambda: PoolFalso())
+    monkeypatch.setitem(ifinance.app.config, "IMPORTACAO_FOLDER", str(tmp_path))
+    snapshot = json.dumps({"next_id": 3, "transacoes": [
+        {"id": 1, "descricao": "Mercado", "valor_total": -80.0, "data": "2024-01-02"},
+        {"id": 2, "descricao": "Freela", "valor_total": 500.0, "data": "2024-01-03"},
+    ]}).encode()
+
+    resp = cliente.post("/importar", data={"arquivo": (io.BytesIO(snapshot), "dados_ifinance.json")},
+                        content_type="multipart/form-data")
+
+    assert resp.status_code == 302 and f"job={enviados[0]}" in resp.headers["Location"]
+    assert ifinance.Transacao.query.filter_by(user_id=usuario.id).count() == 0  # nada roda na requisição
+
+    ifinance._executar_job(enviados[0])
+    ctx.expire_all()
+    job = ctx.get(ifinance.Job, enviados[0])
+    assert job.tipo == "importar_legado" and job.status == "concluido"
+    assert json.loads(job.resultado)["inseridas"] == 2
+    assert ifinance.Transacao.query.filter_by(user_id=usuario.id).count() == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_arquivamento_pelo_site_vai_para_a_fila(ctx, usuario, cliente, monkeypatch):
+    monkeypatch.setattr(ifinance, "_executor", lambda: type("Pool", (), {"submit": lambda *a: None})())
+
+    assert cliente.post("/importar", data={}).status_code == 302
+    resp = cliente.post("/arquivar")
+
+    assert resp.status_code == 302
+    jobs = ifinance.Job.query.filter_by(user_id=usuario.id).all()
+    assert [j.tipo for j in jobs] == ["arquivamento"]
+    assert b'id="painelJob"' in cliente.get(resp.headers["Location"]).data
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# schema de antes de categoria_id/observacoes/pago/recorrente/tipo_entrada, valores em Float
+SCHEMA_ANTIGO = """
+CREATE TABLE users (
+    id INTEGER NOT NULL PRIMARY KEY, email VARCHAR(180) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL, created_at DATETIME
+);
+CREATE TABLE transacoes (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, descricao VARCHAR(255) NOT NULL,
+    valor_total FLOAT NOT NULL, tipo VARCHAR(20) NOT NULL, data DATE NOT NULL,
+    parcelas INTEGER NOT NULL, valor_parcela FLOAT NOT NULL, created_at DATETIME
+);
+CREATE TABLE categorias (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, nome VARCHAR(100) NOT NULL,
+    created_at DATETIME
+);
+INSERT INTO users (id, email, password_hash) VALUES (1, 'a@a', 'x');
+INSERT INTO transacoes VALUES (1, 1, 'Notebook', -1000.0, 'saida', '2025-01-31', 3, -333.333, NULL);
+INSERT INTO transacoes VALUES (2, 1, 'Salário', 4321.1, 'entrada', '2025-01-05', 1, 4321.1, NULL);
+"""
+
+
+def iniciar_app(caminho):
+    """Sobe o app (e a migração do import) num processo novo contra o banco `caminho`."""
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + caminho)
+    env.pop("DATABASE_READ_URL", None)
+    env.pop("JOBS_DURAVEIS", None)
+    r = subprocess.run([sys.executable, "-c", "import app"], cwd=RAIZ, env=env, capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
+
+
+def colunas(con, tabela):
+    return {c[1] for c in con.execute(f"PRAGMA table_info({tabela})")}
+
+
+def test_banco_antigo_migra_para_centavos(tmp_path):
+    caminho = str(tmp_path / "antigo.db")
+    with sqlite3.connect(caminho) as con:
+        con.executescript(SCHEMA_ANTIGO)
+
+    iniciar_app(caminho)
+    iniciar_app(caminho)  # segundo boot não refaz nada
+
+    with sqlite3.connect(caminho) as con:
+        assert con.execute(
+            "SELECT id, valor_total_centavos, valor_parcela_centavos, recorrente FROM transacoes ORDER BY id"
+        ).fetchall() == [(1, -100000, -33334, 0), (2, 432110, 432110, 0)]
+        assert con.execute(
+            "SELECT COUNT(*) FROM transacoes WHERE fingerprint IS NULL OR hash_importacao IS NULL"
+        ).fetchone() == (0,)
+        assert con.execute("SELECT valor_centavos FROM parcelas_agenda ORDER BY numero").fetchall() == [
+            (-33334,), (-33333,), (-33333,)
+        ]
+        assert not {"valor_total", "valor_parcela"} & colunas(con, "transacoes")
+
+
+def test_migracao_interrompida_e_retomada(tmp_path):
+    # boot anterior caiu depois de criar as colunas em centavos, antes de preenchê-las
+    caminho = str(tmp_path / "parcial.db")
+    with sqlite3.connect(caminho) as con:
+        con.executescript(SCHEMA_ANTIGO)
+        con.executescript("""
+            ALTER TABLE transacoes ADD COLUMN valor_total_centavos BIGINT;
+            ALTER TABLE transacoes ADD COLUMN valor_parcela_centavos BIGINT;
+            ALTER TABLE categorias ADD COLUMN orcamento FLOAT;
+            ALTER TABLE categorias ADD COLUMN orcamento_centavos BIGINT;
+            INSERT INTO categorias (id, user_id, nome, orcamento) VALUES (1, 1, 'Casa', 800.5);
+        """)
+
+    iniciar_app(caminho)
+
+    with sqlite3.connect(caminho) as con:
+        assert con.execute("SELECT COUNT(*) FROM transacoes WHERE valor_total_centavos IS NULL").fetchone() == (0,)
+        assert con.execute("SELECT orcamento_centavos FROM categorias").fetchall() == [(80050,)]
+        assert "orcamento" not in colunas(con, "categorias")
@@ -0,0 +1,64 @@
+from datetime import date
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def alertas(user_id: int) -> dict:
+    return {
+        (a.categoria_id, ifinance._num_mes(a.ano, a.mes)): a.nivel
+        for a in ifinance.AlertaOrcamento.query.filter_by(user_id=user_id)
+    }
+
+
+def test_escrita_avalia_so_os_meses_tocados(ctx, usuario):
+    casa = ifinance.Categoria(user_id=usuario.id, nome="Casa", orcamento=1000.0)
+    ctx.add(casa)
+    ctx.commit()
+    t = nova_transacao(usuario.id, "Sofá", -1700.0, date(2025, 1, 10), parcelas=2, categoria_id=casa.id)
+
+    ifinance.avaliar_orcamentos(usuario.id, ifinance.meses_tocados(None, ifinance.snapshot_transacao(t)))
+
+    jan, fev = ifinance._num_mes(2025, 1), ifinance._num_mes(2025, 2)
+    assert alertas(usuario.id) == {(casa.id, jan): 80, (casa.id, fev): 80}
+
+
+def test_janela_das_recorrentes_anda_no_job_do_login_e_nao_no_get(ctx, usuario, cliente, monkeypatch):
+    atual = ifinance._mes_atual()
+    streaming = ifinance.Categoria(user_id=usuario.id, nome="Streaming", orcamento=50.0)
+    ctx.add(streaming)
+    ctx.commit()
+    streaming_id = streaming.id
+
+    # assinatura cadastrada há 14 meses: a escrita só avaliou a janela daquela época
+    monkeypatch.setattr(ifinance, "_mes_atual", lambda: atual - 14)
+    inicio = date((atual - 14) // 12, (atual - 14) % 12 + 1, 1)
+    t = nova_transacao(usuario.id, "Assinatura", -60.0, inicio, parcelas=999, recorrente=True,
+                       categoria_id=streaming_id)
+    ifinance.avaliar_orcamentos(usuario.id, ifinance.meses_tocados(None, ifinance.snapshot_transacao(t)))
+    usuario.orcamentos_mes = atual - 14
+    ctx.commit()
+    monkeypatch.undo()
+    assert (streaming_id, atual) not in alertas(usuario.id)
+
+    # GET / pode cair na réplica: não grava nada
+    assert cliente.get("/").status_code == 200
+    ctx.expire_all()
+    assert (streaming_id, atual) not in alertas(usuario.id)
+    assert ctx.get(ifinance.User, usuario.id).orcamentos_mes == atual - 14
+
+    enviados = []
+
+    class PoolFalso:
+        def submit(self, fn, job_id):
+            enviados.append(job_id)
+
+    monkeypatch.setattr(ifinance, "_executor", lambda: PoolFalso())
+    monkeypatch.setattr(ifinance, "check_password_hash", lambda h, p: True)
+    assert ifinance.app.test_client().post("/login", data={"email": usuario.email, "password": "x"}).status_code == 302
+    assert [ctx.get(ifinance.Job, j).tipo for j in enviados] == ["reavaliar_orcamentos"]
+
+    ifinance._executar_job(enviados[0])
+    ctx.expire_all()
+    assert alertas(usuario.id)[(streaming_id, atual)] == 100
+    assert ctx.get(ifinance.User, usuario.id).orcamentos_mes == atual
@@ -0,0 +1,44 @@
+from datetime import date
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def test_parcela_paga_sai_da_projecao_e_do_total_pendente(ctx, usuario, cliente):
+    hoje = date.today()
+    t = nova_transacao(usuario.id, "Celular", -300.0, hoje.replace(day=1), parcelas=3)
+    nova_transacao(usuario.id, "Salário", 1000.0, hoje.replace(day=5), parcelas=999,
+                   recorrente=True, tipo_entrada="salario")
+    primeira = t.agenda[0].id
+
+    antes = cliente.get("/projecao?meses=4").get_json()
+    assert antes["despesas"] == [100.0, 100.0, 100.0, 0.0]
+
+    cliente.post(f"/parcelas/{primeira}/pagar")
+
+    depois = cliente.get("/projecao?meses=4").get_json()
+    assert depois["despesas"] == [0.0, 100.0, 100.0, 0.0]
+    assert depois["entradas"] == [1000.0] * 4
+    assert depois["saldo_acumulado"][-1] == 4000.0 - 200.0
+
+    parcelas = cliente.get(f"/parcelas?mes={hoje.month}&ano={hoje.year}").get_json()
+    assert parcelas["total"] == 100.0
+    assert parcelas["total_pendente"] == 0.0
+
+
+def test_dashboard_paga_uma_parcela_e_tira_do_total_do_mes(ctx, usuario, cliente):
+    hoje = date.today()
+    t = nova_transacao(usuario.id, "Celular", -300.0, hoje.replace(day=1), parcelas=3)
+    nova_transacao(usuario.id, "Netflix", -39.9, hoje.replace(day=1), parcelas=999, recorrente=True)
+    pagar = f"/parcelas/{t.agenda[0].id}/pagar"
+    url = f"/?mes={hoje.month}&ano={hoje.year}"
+
+    html = cliente.get(url).get_data(as_text=True)
+    assert pagar in html
+    assert "R$ 139.90" in html  # card de saídas: parcela + mensalidade
+
+    cliente.post(pagar)
+
+    html = cliente.get(url).get_data(as_text=True)
+    assert pagar not in html and "✓ paga" in html
+    assert "R$ 39.90" in html and "R$ 139.90" not in html
@@ -0,0 +1,140 @@
+import random
+from datetime import date
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def esperado(snaps, m: int, lado: str, categoria="total") -> int:
+    """Força bruta, mês a mês: parcelas no mês de cada uma, recorrentes todo mês desde o início."""
+    ano, mes = m // 12, m % 12 + 1
+    total = 0
+    for t in snaps:
+        if categoria != "total" and t["categoria_id"] != categoria:
+            continue
+        if lado == "entradas" and t["valor_total_centavos"] > 0:
+            if t["recorrente"]:
+                total += ifinance.saida_no_mes_centavos(t, ano, mes)  # devolve o valor absoluto da mensalidade
+            elif (t["data"].year, t["data"].month) == (ano, mes):
+                total += t["valor_total_centavos"]
+        elif lado == "saidas" and t["valor_total_centavos"] < 0:
+            total += ifinance.saida_no_mes_centavos(t, ano, mes)
+    return total
+
+
+def snapshot_aleatorio(rnd: random.Random, tid: int, categorias) -> dict:
+    recorrente = rnd.random() < 0.15
+    saida = rnd.random() < 0.8
+    parcelas = 999 if recorrente else rnd.choice([1, 1, 2, 3, 7, 12])
+    valor = round(rnd.uniform(1, 900), 2) * (-1 if saida else 1)
+    return ifinance.linha_bulk_transacao(
+        valor,
+        id=tid,
+        descricao=f"t{tid}",
+        data=date(rnd.randint(2022, 2027), rnd.randint(1, 12), rnd.randint(1, 28)),
+        parcelas=parcelas,
+        categoria_id=rnd.choice(categorias),
+        recorrente=recorrente,
+        tipo_entrada=None,
+    )
+
+
+def conferir(indice, snaps, categorias, meses):
+    for chave in ["total"] + categorias:
+        for lado in ("entradas", "saidas"):
+            for m in meses:
+                assert ifinance.somar_periodo(indice, chave, lado, m, m) == esperado(snaps, m, lado, chave), (chave, lado, m)
+
+
+def test_somas_de_prefixo_batem_com_a_forca_bruta(ctx, usuario):
+    rnd = random.Random(7)
+    cats = [ifinance.Categoria(user_id=usuario.id, nome=nome) for nome in ("A", "B")]
+    ctx.add_all(cats)
+    ctx.commit()
+    categorias = [None] + [c.id for c in cats]
+    snaps = []
+    for i in range(25):
+        s = snapshot_aleatorio(rnd, i, categorias)
+        t = nova_transacao(usuario.id, s["descricao"], s["valor_total_centavos"] / 100, s["data"], s["parcelas"],
+                           recorrente=s["recorrente"], categoria_id=s["categoria_id"])
+        snaps.append(ifinance.snapshot_transacao(t))
+
+    indice = ifinance._construir_relatorio(usuario.id)
+    meses = range(ifinance._num_mes(2021, 6), ifinance._num_mes(2030, 1))
+    conferir(indice, snaps, categorias, meses)
+
+    # intervalo = soma dos meses, inclusive depois do fim do array (só recorrentes)
+    ini, fim = ifinance._num_mes(2023, 3), ifinance._num_mes(2031, 8)
+    assert ifinance.somar_periodo(indice, "total", "saidas", ini, fim) == sum(
+        esperado(snaps, m, "saidas") for m in range(ini, fim + 1)
+    )
+
+
+def test_aplicar_incremental_equivale_a_reconstruir():
+    rnd = random.Random(11)
+    categorias = [None, 1, 2]
+    indice = ifinance._relatorio_vazio(ifinance._num_mes(2025, 1))
+    vivos = {}
+
+    for passo in range(60):
+        op = rnd.choice(["criar", "criar", "editar", "remover"]) if vivos else "criar"
+        if op == "criar":
+            depois = snapshot_aleatorio(rnd, passo, categorias)
+            ifinance._aplicar_relatorio(indice, None, depois)
+            vivos[passo] = depois
+        elif op == "editar":
+            tid = rnd.choice(list(vivos))
+            depois = snapshot_aleatorio(rnd, tid, categorias)
+            ifinance._aplicar_relatorio(indice, vivos[tid], depois)
+            vivos[tid] = depois
+        else:
+            tid = rnd.choice(list(vivos))
+            ifinance._aplicar_relatorio(indice, vivos.pop(tid), None)
+
+    conferir(indice, list(vivos.values()), categorias,
+             range(ifinance._num_mes(2021, 1), ifinance._num_mes(2029, 12)))
+    # o array cresceu para os dois lados e continua em centavos inteiros
+    assert indice["base"] < ifinance._num_mes(2025, 1)
+    for lados in indice["series"].values():
+        for serie in lados.values():
+            assert all(type(v) is int for v in serie["p"]) and type(serie["taxa"]) is int
+
+
+def test_salario_recorrente_conta_todo_mes(ctx, usuario):
+    nova_transacao(usuario.id, "Salário", 5000.0, date(2024, 3, 5), parcelas=999,
+                   recorrente=True, tipo_entrada="salario")
+    nova_transacao(usuario.id, "Freela", 800.0, date(2024, 6, 10))
+
+    indice = ifinance._construir_relatorio(usuario.id)
+    resumo = ifinance.resumo_periodo(indice, ifinance._num_mes(2024, 1), ifinance._num_mes(2024, 12))
+
+    assert resumo["entradas"] == 10 * 5000.0 + 800.0
+
+
+def test_datas_distantes_nao_esticam_o_array(ctx, usuario):
+    snaps = [
+        ifinance.snapshot_transacao(t) for t in (
+            nova_transacao(usuario.id, "Digitada errado", -120.0, date(202, 5, 1), parcelas=3),
+            nova_transacao(usuario.id, "Assinatura antiga", -10.0, date(202, 7, 1), parcelas=999, recorrente=True),
+            nova_transacao(usuario.id, "Mercado", -300.0, date(2025, 4, 10)),
+            nova_transacao(usuario.id, "Futuro distante", 50.0, date(9999, 1, 1)),
+        )
+    ]
+
+    indice = ifinance._construir_relatorio(usuario.id)
+    assert indice["n"] <= 2 * ifinance.RELATORIO_JANELA_MESES + 1
+    meses = [ifinance._num_mes(202, m) for m in range(4, 10)] + [ifinance._num_mes(2025, m) for m in (3, 4, 5)]
+    meses += [ifinance._num_mes(9998, 12), ifinance._num_mes(9999, 1), ifinance._num_mes(9999, 2)]
+    conferir(indice, snaps, [], meses)
+    ini, fim = ifinance._num_mes(100, 1), ifinance._num_mes(2025, 12)
+    assinatura = 1000 * (fim - ifinance._num_mes(202, 7) + 1)
+    assert ifinance.somar_periodo(indice, "total", "saidas", ini, fim) == 12000 + assinatura + 30000
+
+    # remover e recolocar pelo caminho incremental desfaz e refaz os trechos soltos
+    ifinance._aplicar_relatorio(indice, snaps[0], None)
+    conferir(indice, snaps[1:], [], meses)
+    ifinance._aplicar_relatorio(indice, snaps[3], None)
+    ifinance._aplicar_relatorio(indice, None, snaps[3])
+    conferir(indice, snaps[1:], [], meses)
+    futuro = ifinance._num_mes(9999, 1)
+    assert indice["series"]["total"]["entradas"]["depois"] == [(futuro, futuro, 5000)]
@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta
+
+import app as ifinance
+from conftest import nova_transacao
+
+
+def paginar(cliente, cursor=None) -> tuple[list[dict], list[int], str]:
+    transacoes, removidas = [], []
+    while True:
+        resp = cliente.get("/api/sync", query_string={"cursor": cursor} if cursor else {})
+        assert resp.status_code == 200
+        dados = resp.get_json()
+        assert len(dados["transacoes"]) <= ifinance.app.config["SYNC_LIMITE"]
+        transacoes += dados["transacoes"]
+        removidas += dados["removidas"]
+        cursor = dados["cursor"]
+        if not dados["mais"]:
+            return transacoes, removidas, cursor
+
+
+def test_paginas_cobrem_tudo_sem_repetir_mesmo_com_updated_at_empatado(ctx, usuario, cliente, monkeypatch):
+    monkeypatch.setitem(ifinance.app.config, "SYNC_LIMITE", 3)
+    ids = [nova_transacao(usuario.id, f"Compra {i}", -10.0 - i, date(2025, 1, 1)).id for i in range(8)]
+    # todas com o mesmo updated_at: o desempate é pelo id do cursor
+    empate = datetime.utcnow() - timedelta(hours=1)
+    ifinance.Transacao.query.filter(ifinance.Transacao.id.in_(ids)).update(
+        {"updated_at": empate}, synchronize_session=False
+    )
+    ctx.commit()
+
+    transacoes, _, _ = paginar(cliente)
+
+    recebidos = [t["id"] for t in transacoes]
+    assert sorted(recebidos) == sorted(ids)
+    assert len(recebidos) == len(set(recebidos))
+
+
+def test_delta_traz_alteradas_e_removidas(ctx, usuario, cliente):
+    a = nova_transacao(usuario.id, "Mercado", -50.0, date(2025, 2, 1))
+    b = nova_transacao(usuario.id, "Padaria", -8.0, date(2025, 2, 2))
+    antigo = datetime.utcnow() - timedelta(hours=1)
+    ifinance.Transacao.query.filter(ifinance.Transacao.id.in_([a.id, b.id])).update(
+        {"updated_at": antigo}, synchronize_session=False
+    )
+    ctx.commit()
+    _, _, cursor = paginar(cliente)
+
+    cliente.post(f"/editar/{a.id}", data={"descricao": "Mercado Extra", "valor": "55", "tipo": "saida",
+                                          "data": "2025-02-01", "parcelas": "1"})
+    cliente.post(f"/remover/{b.id}")
+    transacoes, removidas, _ = paginar(cliente, cursor)
+
+    assert [t["descricao"] for t in transacoes] == ["Mercado Extra"]
+    assert removidas == [b.id]
+
+
+def test_carga_completa_pagina_tambem_o_arquivo(ctx, usuario, cliente, monkeypatch):
+    monkeypatch.setitem(ifinance.app.config, "SYNC_LIMITE", 2)
+    abertas = [nova_transacao(usuario.id, f"Aberta {i}", -5.0, date(2025, 3, 1)).id for i in range(3)]
+    pagas = [nova_transacao(usuario.id, f"Paga {i}", -5.0, date(2020, 1, 1), pago=True).id for i in range(5)]
+    assert ifinance.arquivar_transacoes(meses=1, user_id=usuario.id) == 5
+
+    transacoes, _, cursor = paginar(cliente)
+
+    assert sorted(t["id"] for t in transacoes if not t["arquivada"]) == sorted(abertas)
+    assert sorted(t["id"] for t in transacoes if t["arquivada"]) == sorted(pagas)
+    assert len(transacoes) == 8
+    assert "~" not in cursor  # a carga termina com um cursor de delta comum
+
+
+def test_cursor_invalido(cliente):
+    assert cliente.get("/api/sync?cursor=ontem").status_code == 400
+    assert cliente.get("/api/sync?cursor=arquivo~2025-01-01T00:00:00_1").status_code == 400